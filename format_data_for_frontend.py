@@ -2,7 +2,7 @@ import os, shutil, io
 
 from tools import json2arbo, prepare_articles, update_procedure, \
     prepare_amendements, prepare_interventions, reorder_interventions_and_correct_procedure, \
-    compute_stats, add_links
+    compute_stats, add_links, timings
 from tools.common import debug_file, print_json
 
 
@@ -41,32 +41,40 @@ def process(dos, OUTPUT_DIR, log=io.StringIO(), skip_already_done=False):
     shutil.rmtree(output_dir, ignore_errors=True)
 
     debug_file(dos, 'debug_before_add_links.json')
-    dos = add_links.process(dos)
+    with timings.stage('add_links'):
+        dos = add_links.process(dos)
 
     # add texte.json and write all the text files tree
     debug_file(dos, 'debug_before_json2arbo.json')
-    dos = json2arbo.process(dos, output_dir + '/procedure')
+    with timings.stage('json2arbo'):
+        dos = json2arbo.process(dos, output_dir + '/procedure')
 
     print(' - process article versions')
     json2arbo.mkdirs(os.path.join(output_dir, 'viz'))
     debug_file(dos, 'debug_before_prepare_articles.json')
-    articles_etapes = prepare_articles.process(dos)
-    print_json(articles_etapes, os.path.join(output_dir, 'viz', 'articles_etapes.json'))
+    with timings.stage('prepare_articles'):
+        articles_etapes = prepare_articles.process(dos)
+        print_json(articles_etapes, os.path.join(output_dir, 'viz', 'articles_etapes.json'))
 
-    procedure = update_procedure.process(dos, articles_etapes)
+    with timings.stage('update_procedure'):
+        procedure = update_procedure.process(dos, articles_etapes)
 
     print(' - process amendements & interventions')
-    procedure = prepare_amendements.process(output_dir, procedure)
+    with timings.stage('prepare_amendements'):
+        procedure = prepare_amendements.process(output_dir, procedure)
 
     print(' - re-order interventions and correct procedure dates')
-    procedure = reorder_interventions_and_correct_procedure.process(output_dir, procedure)
+    with timings.stage('reorder_interventions'):
+        procedure = reorder_interventions_and_correct_procedure.process(output_dir, procedure)
 
     print(' - prepare interventions.json')
-    prepare_interventions.process(output_dir, procedure)
+    with timings.stage('prepare_interventions'):
+        prepare_interventions.process(output_dir, procedure)
 
     print(' - compute stats')
     debug_file(dos, 'debug_before_stats.json')
-    procedure['stats'] = compute_stats.process(output_dir, procedure)
+    with timings.stage('compute_stats'):
+        procedure['stats'] = compute_stats.process(output_dir, procedure)
 
     # remove intermediate data
     for step in procedure['steps']:
@@ -1,9 +1,7 @@
 import re
 
-from lawfactory_utils.urls import download
-from senapy.dosleg.parser import parse as senapy_parse
-
-from tools import parse_texte, complete_articles
+from tools import dosleg_cache, parse_texte, complete_articles, timings, spill, downloader, url_resolutions
+from tools.downloader import download
 from tools._step_logic import get_previous_step, use_old_procedure, is_one_of_the_initial_depots, should_ignore_commission_text
 from tools.common import debug_file
 
@@ -15,14 +13,102 @@ def test_status(url):
     return resp
 
 
+def fix_an_url(url):
+    if 'documents/notice/' in url:
+        url = url.replace('www2', 'www').replace('documents/notice/', '').split('/(index)')[0] + '.asp'
+
+    if url.endswith('.pdf'):
+        url = url.replace('/pdf/', '/propositions/').replace('.pdf', '.asp')
+    return url
+
+
+# the title of the text adopted by the commission in a Senat report
+re_commission_text = re.compile(r'TEXTE\s+&Eacute;LABOR&Eacute;\s+PAR|EXAMEN\s+EN\s+COMMISSION')
+
+# pages of a report downloaded at the same time
+REPORT_PAGES_BATCH = 4
+
+# report url -> url of the page with the text, or None if there's none
+_report_pages = {}
+
+
+def has_commission_text(resp):
+    return re_commission_text.search(resp.text.replace('<br>', '\n')) is not None
+
+
+def report_pages(url):
+    return [url.replace('.html', page + '.html') for page in '0123456789']
+
+
+def find_senat_report_page(url):
+    """
+    returns the url of the page of a multi-page report with the text of the
+    commission, the _mono page if the text is on several pages or None
+    """
+    # we try to use the last page to get a clean text
+    pages = report_pages(url)
+    clean_url = None
+    for batch_start in range(0, len(pages), REPORT_PAGES_BATCH):
+        batch = pages[batch_start:batch_start + REPORT_PAGES_BATCH]
+        if not spill.enabled():
+            downloader.prefetch(batch)
+        for new_url in batch:
+            resp = test_status(new_url)
+            if not resp:
+                break
+            # look for the "TEXTE ÉLABORÉ PAR .."" TITLE
+            if has_commission_text(resp):
+                # if the previous page was valid also, then the text is multi-page
+                if clean_url:
+                    clean_url = None
+                    break
+                clean_url = new_url
+        else:
+            continue
+        break
+
+    if clean_url:
+        return clean_url
+    # use _mono as last resort
+    mono_url = url.replace('.html', '_mono.html')
+    if test_status(mono_url):
+        return mono_url
+
+
+def find_senat_report_resp(url):
+    if url not in _report_pages:
+        _report_pages[url] = find_senat_report_page(url)
+    if _report_pages[url]:
+        return test_status(_report_pages[url])
+
+
 def find_good_url_resp(url):
+    """returns the response of the page with the text of an url, or a falsy value"""
+    known = url_resolutions.lookup(url_resolutions.TEXT, url)
+    if known:
+        if not known['resolved_url']:
+            return False
+        resp = test_status(known['resolved_url'])
+        if resp:
+            return resp
+        # the page moved, look for it again
+
+    resp = resolve_good_url_resp(url)
+    # None: the text is not published yet, it must be looked for again next time
+    if resp is not None:
+        url_resolutions.remember(url_resolutions.TEXT, url, resp.url if resp else None, resp.status_code if resp else None)
+    return resp
+
+
+def resolve_good_url_resp(url):
+    """the response of the page with the text, False if there's none or None if it's not published yet"""
     if 'senat.fr' in url:
         # Depot steps can sometime link a previous abandonned dosleg
         # ex: http://www.senat.fr/dossier-legislatif/ppl09-338.html
         if '/dossier-legislatif/' in url:
             resp = test_status(url)
             if resp:
-                dos = senapy_parse(resp.text, url)
+                dos = dosleg_cache.parse_senat(resp.text, url)
                 return find_good_url_resp(dos['steps'][0]['source_url'])
 
         if '/leg/' in url and url.endswith('.html'):
@@ -30,31 +116,9 @@ def find_good_url_resp(url):
             if resp:
                 return resp
         if '/rap/' in url:
-            # we try to use the last page to get a clean text
-            clean_url_resp = None
-            for page in '0123456789':
-                new_url = url.replace('.html', page + '.html')
-                resp = test_status(new_url)
-                if not resp:
-                    break
-                text = resp.text.replace('<br>', '\n')
-                # look for the "TEXTE ÉLABORÉ PAR .."" TITLE
-                if re.match(r'.*TEXTE\s+&Eacute;LABOR&Eacute;\s+PAR.*', text, re.M | re.DOTALL) \
-                    or re.match(r'.*EXAMEN\s+EN\s+COMMISSION.*', text, re.M | re.DOTALL):
-                    # if the previous page was valid also, then the text is multi-page
-                    if clean_url_resp:
-                        clean_url_resp = None
-                        break
-                    clean_url_resp = resp
-
-            if clean_url_resp:
-                return clean_url_resp
-            else:
-                # use _mono as last resort
-                mono_url = url.replace('.html', '_mono.html')
-                resp = test_status(mono_url)
-                if resp:
-                    return resp
+            resp = find_senat_report_resp(url)
+            if resp:
+                return resp
 
     if 'assemblee-nationale.fr' in url:
         if '/cr-' in url:
@@ -62,11 +126,7 @@ def find_good_url_resp(url):
         if '/dossiers/' in url:
             return False
 
-        if 'documents/notice/' in url:
-            url = url.replace('www2', 'www').replace('documents/notice/', '').split('/(index)')[0] + '.asp'
-
-        if url.endswith('.pdf'):
-            url = url.replace('/pdf/', '/propositions/').replace('.pdf', '.asp')
+        url = fix_an_url(url)
 
         """
         # /textes/ URL are not supported yet in parse_text
@@ -93,12 +153,12 @@ def find_good_url_resp(url):
         """
 
         resp = test_status(url)
-        if not resp \
-            or "n'est pas encore édité" in resp.text \
-            or ">Cette division n'est pas encore distribuée<" in resp.text:
+        if not resp:
             return False
-        else:
-            return resp
+        if "n'est pas encore édité" in resp.text \
+            or ">Cette division n'est pas encore distribuée<" in resp.text:
+            return None
+        return resp
 
     resp = test_status(url)
     if resp:
@@ -106,6 +166,35 @@ def find_good_url_resp(url):
     return False
 
 
+def step_text_url(dos, step):
+    """the url of the text to parse for a step, or None"""
+    if should_ignore_commission_text(step, dos) or step.get('stage') == 'promulgation':
+        return None
+    # we parse the JO texte only if there's a CC decision
+    if step.get('stage') == 'constitutionnalité':
+        return dos.get('url_jo')
+    return step.get('source_url')
+
+
+def remote_urls(dos):
+    """urls that `find_good_url_resp` will most likely try first for the texts of the steps"""
+    urls = []
+    for step in dos['steps']:
+        url = step_text_url(dos, step)
+        if not url:
+            continue
+        if 'assemblee-nationale.fr' in url:
+            if '/cr-' in url or '/dossiers/' in url:
+                continue
+            urls.append(fix_an_url(url))
+        elif 'senat.fr' in url and '/rap/' in url:
+            # the next pages are probed by find_senat_report_page, most reports have only a few
+            urls.append(report_pages(url)[0])
+        else:
+            urls.append(url)
+    return urls
+
+
 def parse_texts(dos):
     print('** parsing texts')
 
@@ -132,7 +221,8 @@ def parse_texts(dos):
                     raise Exception('[parse_texts] Empty url for step: %s.%s.%s' % (step.get('institution'), step.get('stage'), step.get('step')))
                 continue
             else:
-                fixed_url_resp = find_good_url_resp(url)
+                with timings.stage('find_good_url_resp'):
+                    fixed_url_resp = find_good_url_resp(url)
                 if fixed_url_resp:
                     fixed_url = fixed_url_resp.url
                     if fixed_url != url:
@@ -141,7 +231,8 @@ def parse_texts(dos):
                     if step.get('stage') != 'constitutionnalité':
                         step['source_url'] = fixed_url
 
-                    articles = parse_texte.parse(fixed_url, resp=fixed_url_resp)
+                    with timings.stage('parse_texte'):
+                        articles = parse_texte.parse(fixed_url, resp=fixed_url_resp)
                     debug_file(articles, 'debug_parsed_text_step_%d.json' % step_index)
 
                     if not articles:
@@ -163,6 +254,8 @@ def parse_texts(dos):
 
                     if not step.get('echec') and len(articles) == 1:
                         raise Exception('parsing failed for %s (no text)' % fixed_url)
+
+                    spill.spill(step, 'articles')
                 else:
                     raise Exception('[parse_texts] Invalid response %s' % url)
         except Exception as e:
@@ -189,7 +282,7 @@ def re_order_cmp(dos):
     if cmp_hemi_steps and len(cmp_hemi_steps) == 2:
         first_i, second_i = cmp_hemi_steps
         first = dos['steps'][first_i]
-        if first.get('articles', [{}])[0].get('definitif') or first.get('echec'):
+        if spill.load(first.get('articles', [{}]))[0].get('definitif') or first.get('echec'):
             print('     * re-ordered CMP steps')
             steps = dos['steps']
             steps[first_i], steps[second_i] = steps[second_i], steps[first_i]
@@ -212,25 +305,27 @@ def complete_texts(dos):
                     if step.get('step') == 'hemicycle' and steps[prev_step_index].get('step') == 'commission':
                         antestep_index = get_previous_step(steps, prev_step_index, use_old_procedure(step, dos), get_depot_step=True)
                         if antestep_index is not None and steps[antestep_index].get('step') == 'depot':
-                            anteprevious = steps[antestep_index].get(
+                            anteprevious = spill.load(steps[antestep_index].get(
                                 'articles_completed',
                                 steps[antestep_index].get('articles', [])
-                            )
+                            ))
 
                     prev_step = steps[prev_step_index]
                     complete_args = {
-                        'current': step.get('articles', []),
-                        'previous': prev_step.get(
+                        'current': spill.get(step, 'articles', []),
+                        'previous': spill.load(prev_step.get(
                             'articles_completed',
                             prev_step.get('articles', [])
-                        ),
+                        )),
                         'step': step,
                         'table_concordance': dos.get('table_concordance', {}),
                         'anteprevious': anteprevious,
                     }
                     debug_file(complete_args, 'debug_complete_args_step_%d.json' % step_index)
-                    step['articles_completed'] = complete_articles.complete(**complete_args)
+                    with timings.stage('complete_articles'):
+                        step['articles_completed'] = complete_articles.complete(**complete_args)
                     debug_file(step.get('articles_completed'), 'debug_completed_text_step_%d.json' % step_index)
+                    spill.spill(step, 'articles_completed')
 
 
 def process(dos):
@@ -1,31 +1,278 @@
-import os, sys, glob, traceback
+"""
+Usage: python parse_many.py <api_directory> [--jobs N] [--max-per-worker K] < urls
+       python parse_many.py enqueue <api_directory> < urls
+       python parse_many.py worker <api_directory>
+       python parse_many.py status <api_directory>
+
+Parse every dosleg url given on stdin
+
+Or load them in the queue of the data directory with `enqueue` and start as
+many `worker` as needed, on this host or on others sharing the directory.
+A worker stops when the queue is empty.
+
+Options:
+    --jobs N: parse N doslegs at the same time in worker processes
+    --max-per-worker K: recycle a worker after K doslegs to bound its memory (default: 20)
+    --skip-unchanged: do not parse again a dosleg if none of its inputs changed
+    --reuse-from DIR: same as --skip-unchanged but also look for the parsed
+                      doslegs in DIR and copy them if they are unchanged
+    --resume RUN_ID: continue an interrupted run with the doslegs it did not
+                     finish, the urls are read from its journal instead of stdin
+    --retry-errors: with --resume, also parse again the doslegs that failed
+    --lease SECONDS: with worker, time after which the job of a dead worker is
+                     given to another one (default: 600)
+    --max-attempts N: with worker, times a failing dosleg is tried (default: 3)
+    --archive: keep every downloaded response in the archive (see tools/archive.py)
+    --offline: only read the responses from the archive, without network
+"""
+import os, sys, glob, shutil, time, traceback
+from multiprocessing import Pool
 
 import parse_one
 
+from tools import downloader, fingerprints, run_journal, job_queue, reference_data, timings
 from tools.common import open_json
 
 verbose = "--quiet" not in sys.argv
 
-API_DIRECTORY = sys.argv[1]
-
-already_done = {}
-for jsondos in glob.glob(os.path.join(API_DIRECTORY, '*/viz/procedure.json')):
-    dos = open_json(jsondos)
-    if dos.get('url_jo'):
-        already_done[dos.get('url_dossier_senat')] = True
-
-for url in sys.stdin:
-    url = url.strip()
-    if url in already_done:
-        if verbose:
-            print()
-            print('======')
-            print(url)
-            print('  + passed, already done:', url)
-        continue
+
+def get_option(name, default=None):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def find_already_done(api_directory):
+    already_done = {}
+    for jsondos in glob.glob(os.path.join(api_directory, '*/viz/procedure.json')):
+        dos = open_json(jsondos)
+        if dos.get('url_jo'):
+            already_done[dos.get('url_dossier_senat')] = True
+    return already_done
+
+
+def is_unchanged(api_directory, url, reuse_directory=None):
+    url_id = parse_one.get_url_id(url)
     try:
-        parse_one.process(API_DIRECTORY, url)
+        fingerprint = fingerprints.load(api_directory, url_id)
+        if fingerprint and os.path.exists(os.path.join(api_directory, fingerprint['id'])):
+            return fingerprints.is_unchanged(fingerprint, api_directory)
+
+        if reuse_directory:
+            fingerprint = fingerprints.load(reuse_directory, url_id)
+            if fingerprint and os.path.exists(os.path.join(reuse_directory, fingerprint['id'])) \
+                    and fingerprints.is_unchanged(fingerprint, api_directory):
+                output_dir = os.path.join(api_directory, fingerprint['id'])
+                shutil.rmtree(output_dir, ignore_errors=True)
+                shutil.copytree(os.path.join(reuse_directory, fingerprint['id']), output_dir)
+                os.makedirs(os.path.join(api_directory, 'fingerprints'), exist_ok=True)
+                shutil.copy(fingerprints.fingerprint_path(reuse_directory, url_id),
+                    fingerprints.fingerprint_path(api_directory, url_id))
+                return True
+    except Exception as e:
+        print('  WARNING: could not check the fingerprint of', url, '-', type(e).__name__, e)
+    return False
+
+
+def process_one(args):
+    """parse one dosleg, record it in the run journal and returns (url, status, error) instead of raising"""
+    api_directory, url, only_log, journal = args
+    run_journal.append(journal, url, 'started', pid=os.getpid())
+    start = time.time()
+    try:
+        status, exception = _process_one(api_directory, url, only_log)
+    except KeyboardInterrupt:
+        run_journal.append(journal, url, 'interrupted', duration=round(time.time() - start, 3))
+        raise
+    details = {'duration': round(time.time() - start, 3)}
+    if status in ('ok', 'error'):
+        details['timings'] = timings.report()
+    error = None
+    if exception:
+        details['error_class'] = type(exception).__name__
+        details['error'] = str(exception)
+        error = '%s: %s' % (type(exception).__name__, exception)
+    run_journal.append(journal, url, status, **details)
+    return url, status, error
+
+
+def _process_one(api_directory, url, only_log):
+    reuse_directory = get_option('--reuse-from')
+    if '--skip-unchanged' in sys.argv or reuse_directory:
+        if is_unchanged(api_directory, url, reuse_directory):
+            if verbose and not only_log:
+                print()
+                print('======')
+                print(url)
+                print('  + passed, unchanged:', url)
+            return 'unchanged', None
+    try:
+        parse_one.process(api_directory, url, only_log=only_log)
+        return 'ok', None
     except KeyboardInterrupt:
-        break
+        raise
     except Exception as e:
-        traceback.print_exc()
+        if not only_log:
+            traceback.print_exc()
+        return 'error', e
+
+
+def print_timings(journal):
+    reports = [event['timings'] for event in run_journal.read(journal) if event.get('timings')]
+    if reports:
+        print()
+        print('TIMINGS (seconds):')
+        timings.print_percentiles(reports)
+
+
+def print_summary(results):
+    errors = [(url, error) for url, status, error in results if status == 'error']
+    print()
+    print('======')
+    print('PARSED:', len([1 for _, status, _ in results if status == 'ok']))
+    print('SKIPPED:', len([1 for _, status, _ in results if status == 'skipped']))
+    print('UNCHANGED:', len([1 for _, status, _ in results if status == 'unchanged']))
+    print('ERRORS:', len(errors))
+    for url, error in errors:
+        print('  ', url, '-', error)
+
+
+def process(api_directory, urls, jobs=1, max_per_worker=20, run_id=None, retry_errors=False):
+    already_done = find_already_done(api_directory)
+
+    if run_id:
+        journal = run_journal.journal_path(api_directory, run_id)
+        urls = run_journal.remaining_urls(journal, retry_errors=retry_errors)
+        print('resuming run', run_id, '-', len(urls), 'doslegs left')
+    else:
+        run_id = run_journal.new_run_id()
+        journal = run_journal.journal_path(api_directory, run_id)
+        os.makedirs(os.path.dirname(journal), exist_ok=True)
+        urls = [url.strip() for url in urls if url.strip()]
+        for url in urls:
+            run_journal.append(journal, url, 'queued')
+        print('run', run_id, '- resume it with: --resume', run_id)
+
+    results = []
+    todo = []
+    for url in urls:
+        if url in already_done:
+            if verbose:
+                print()
+                print('======')
+                print(url)
+                print('  + passed, already done:', url)
+            results.append((url, 'skipped', None))
+            run_journal.append(journal, url, 'skipped')
+            continue
+        todo.append(url)
+
+    if jobs > 1:
+        # loaded once here so the workers do not race to write those files,
+        # they inherit it and this process keeps it up to date
+        reference_data.get(api_directory)
+
+        pool = Pool(jobs, maxtasksperchild=max_per_worker)
+        try:
+            for url, status, error in pool.imap_unordered(process_one,
+                    [(api_directory, url, True, journal) for url in todo], chunksize=1):
+                print('[%s]' % status, url, error or '')
+                results.append((url, status, error))
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+        pool.join()
+    else:
+        for url in todo:
+            try:
+                results.append(process_one((api_directory, url, False, journal)))
+            except KeyboardInterrupt:
+                break
+
+    print_summary(results)
+    print_timings(journal)
+    return results
+
+
+def enqueue(api_directory, urls):
+    urls = [url.strip() for url in urls if url.strip()]
+    job_queue.JobQueue(api_directory).enqueue(urls)
+    print('queued', len(urls), 'doslegs')
+
+
+def print_status(queue):
+    print(', '.join('%s: %d' % (status, count) for status, count in sorted(queue.counts().items())))
+    for url, error in queue.failures():
+        print('  ', url, '-', error)
+
+
+def worker(api_directory, lease_duration=job_queue.LEASE_DURATION, max_attempts=job_queue.MAX_ATTEMPTS, poll=30):
+    """parse the doslegs of the queue until it is empty"""
+    queue = job_queue.JobQueue(api_directory)
+    worker_id = job_queue.worker_id()
+    run_id = '%s-%s' % (run_journal.new_run_id(), worker_id)
+    journal = run_journal.journal_path(api_directory, run_id)
+    os.makedirs(os.path.dirname(journal), exist_ok=True)
+    print('worker', worker_id, '- journal', run_id)
+
+    already_done = find_already_done(api_directory)
+
+    results = []
+    while True:
+        job = queue.lease(worker_id, lease_duration, max_attempts)
+        if job is None:
+            if not queue.has_unfinished():
+                break
+            # the remaining jobs are leased by other workers or waiting for a retry
+            time.sleep(poll)
+            continue
+        url, attempt = job
+        if url in already_done:
+            queue.done(url, worker_id)
+            run_journal.append(journal, url, 'skipped')
+            results.append((url, 'skipped', None))
+            continue
+
+        heartbeat = job_queue.Heartbeat(queue, url, worker_id, lease_duration)
+        heartbeat.start()
+        try:
+            url, status, error = process_one((api_directory, url, False, journal))
+        except KeyboardInterrupt:
+            queue.release(url, worker_id)
+            break
+        finally:
+            heartbeat.stop()
+        if status == 'error':
+            queue.fail(url, worker_id, error, max_attempts=max_attempts)
+        else:
+            queue.done(url, worker_id)
+        results.append((url, status, error))
+
+    print_summary(results)
+    print_timings(journal)
+    print('queue:', end=' ')
+    print_status(queue)
+    return results
+
+
+if __name__ == '__main__':
+    # the workers inherit it
+    downloader.install()
+    if sys.argv[1] in ('enqueue', 'worker', 'status'):
+        command, API_DIRECTORY = sys.argv[1:3]
+        if command == 'enqueue':
+            enqueue(API_DIRECTORY, sys.stdin)
+        elif command == 'worker':
+            worker(API_DIRECTORY,
+                lease_duration=int(get_option('--lease', job_queue.LEASE_DURATION)),
+                max_attempts=int(get_option('--max-attempts', job_queue.MAX_ATTEMPTS)))
+        else:
+            print_status(job_queue.JobQueue(API_DIRECTORY))
+        sys.exit()
+
+    API_DIRECTORY = sys.argv[1]
+    process(API_DIRECTORY, sys.stdin,
+        jobs=int(get_option('--jobs', 1)),
+        max_per_worker=int(get_option('--max-per-worker', 20)),
+        run_id=get_option('--resume'),
+        retry_errors='--retry-errors' in sys.argv)
@@ -1,14 +1,12 @@
-import sys, contextlib, io, os, traceback
+import sys, contextlib, io, os, tempfile, traceback
 
-from senapy.dosleg.parser import parse as senapy_parse
-from anpy.dossier_like_senapy import parse as anpy_parse
-from lawfactory_utils.urls import download, enable_requests_cache
+from lawfactory_utils.urls import enable_requests_cache
 
+from tools import downloader, dosleg_cache, fingerprints, prepare_amendements, reference_data, timings, spill, url_resolutions
 from tools.detect_anomalies import find_anomalies
+from tools.downloader import download
 from tools.json2arbo import mkdirs
-from tools.download_groupes import process as download_groupes
-from tools.download_lois_dites import process as download_lois_dites
-from tools.common import debug_file
+from tools.common import debug_file, Context
 from merge import merge_senat_with_an
 import parse_doslegs_texts
 import format_data_for_frontend
@@ -16,19 +14,23 @@ import format_data_for_frontend
 
 def download_senat(url, log=sys.stderr, verbose=True):
     if verbose: print('  [] download SENAT version')
-    html = download(url).text
+    with timings.stage('download_senat'):
+        html = download(url).text
     if verbose: print('  [] parse SENAT version')
-    return senapy_parse(html, url, logfile=log)
+    with timings.stage('parse_senat'):
+        return dosleg_cache.parse_senat(html, url, logfile=log)
 
 
 def download_an(url, url_senat=False, log=sys.stderr, verbose=True):
     if verbose: print('  [] download AN version')
-    resp = download(url)
-    resp.encoding = 'Windows-1252'
-    html = resp.text
+    with timings.stage('download_an'):
+        resp = download(url)
+        resp.encoding = 'Windows-1252'
+        html = resp.text
     if verbose: print('  [] parse AN version')
     # TODO: do both instead of first
-    results = anpy_parse(html, url, logfile=log, verbose=verbose)
+    with timings.stage('parse_an'):
+        results = dosleg_cache.parse_an(html, url, logfile=log, verbose=verbose)
     if len(results) > 1:
         if url_senat:
             for result in results:
@@ -42,7 +44,7 @@ def are_same_doslegs(senat_dos, an_dos):
     # same dosleg url ?
     if an_dos['url_dossier_senat'] == senat_dos['url_dossier_senat']:
         return True
-    elif download(an_dos['url_dossier_senat']).status_code == 404:
+    elif url_resolutions.get_status(an_dos['url_dossier_senat']) == 404:
         return True
     # same first text  ?
     if senat_dos.get('steps') and an_dos.get('steps') \
@@ -89,17 +91,32 @@ def download_merged_dos(url, log=sys.stderr, verbose=True):
     return dos, an_dos, senat_dos
 
 
+def prefetch_resources(dos, api_dir):
+    """
+    download concurrently the texts, amendments, seances and parlementaires
+    the next stages will need so they find them in the warm store
+    """
+    dos_id = dos.get('senat_id', dos.get('assemblee_id', ''))
+    # the step logic is verbose, but this is only a plan
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        downloader.prefetch(parse_doslegs_texts.remote_urls(dos) + prepare_amendements.remote_urls(dos))
+        context = Context([0, os.path.join(api_dir, dos_id)], load_parls=True)
+        downloader.prefetch(prepare_amendements.followup_urls(dos, context))
+
+
 @contextlib.contextmanager
-def log_print(file):
+def log_print(file, only_log=False):
     # capture all outputs to a log file while still printing it
+    # (unless `only_log` is set, ex: for parallel workers)
     class Logger:
         def __init__(self, file):
             self.terminal = sys.stdout
             self.log = file
-            self.only_log = False
+            self.only_log = only_log
 
         def write(self, message):
-            self.terminal.write(message)
+            if not self.only_log:
+                self.terminal.write(message)
             self.log.write(message)
 
         def __getattr__(self, attr):
@@ -111,20 +128,45 @@ def log_print(file):
     _stderr = sys.stderr
     sys.stdout = logger
     sys.stderr = logger
-    yield logger.log
-    sys.stdout = _stdout
-    sys.stderr = _stderr
+    try:
+        yield logger.log
+    finally:
+        sys.stdout = _stdout
+        sys.stderr = _stderr
 
 
-def dump_error_log(url, exception, api_dir, log):
-    log = log.getvalue() + '\n' + ''.join(traceback.format_tb(exception.__traceback__))
+class FileLog:
+    """a log kept in a temporary file instead of in memory, for --low-memory"""
+    def __init__(self):
+        self.file = tempfile.TemporaryFile('w+')
+
+    def write(self, message):
+        return self.file.write(message)
 
+    def flush(self):
+        self.file.flush()
+
+    def getvalue(self):
+        self.file.seek(0)
+        value = self.file.read()
+        self.file.seek(0, io.SEEK_END)
+        return value
+
+
+def get_url_id(url):
     url_id = url.replace('/', '')
     if 'assemblee-nationale' in url:
         legi = url.split('.fr/')[1].split('/')[0]
         url_id = legi + url.split('/')[-1].replace('.asp', '')
     elif 'senat.fr' in url:
         url_id = url.split('/')[-1].replace('.html', '')
+    return url_id
+
+
+def dump_error_log(url, exception, api_dir, log):
+    log = log.getvalue() + '\n' + ''.join(traceback.format_tb(exception.__traceback__))
+
+    url_id = get_url_id(url)
 
     mkdirs(os.path.join(api_dir, 'logs'))
     logfile = os.path.join(api_dir, 'logs', url_id)
@@ -133,22 +175,29 @@ def dump_error_log(url, exception, api_dir, log):
     open(logfile, 'w').write(log)
 
 
-def process(API_DIRECTORY, url):
+def process(API_DIRECTORY, url, only_log=False):
     disable_cache = '--enable-cache' not in sys.argv
     only_promulgated = '--only-promulgated' in sys.argv
     verbose = '--quiet' not in sys.argv
     if not disable_cache:
         enable_requests_cache()
-    with log_print(io.StringIO()) as log:
+    timings.reset()
+    reference_data.clear_used()
+    with log_print(FileLog() if spill.enabled() else io.StringIO(), only_log=only_log) as log:
         try:
             if verbose:
                 print('======')
                 print(url)
 
-            dos, an_dos, senat_dos = download_merged_dos(url, log=log, verbose=verbose)
+            with timings.stage('download_dosleg'):
+                dos, an_dos, senat_dos = download_merged_dos(url, log=log, verbose=verbose)
             if not dos:
                 return
 
+            if dos.get('url_jo'):
+                # promulgated, the documents of the dosleg won't change
+                downloader.freeze()
+
             if verbose:
                 print('        title:', dos.get('long_title'))
             find_anomalies([dos], verbose=verbose)
@@ -167,29 +216,47 @@ def process(API_DIRECTORY, url):
             debug_file(senat_dos, 'debug_senat_dos.json')
             debug_file(dos, 'debug_dos.json')
 
-            # download the groupes in case they are not there yet
-            download_groupes(API_DIRECTORY)
+            with timings.stage('download_groupes'):
+                # the groupes, parlementaires and lois dites are only loaded
+                # by the first dosleg of the process, then kept up to date
+                # in the background
+                loi_dite = reference_data.get_loi_dite(API_DIRECTORY, dos.get('legifrance_cidTexte'))
 
             # Add potential common name from Legifrance's "Lois dites"
-            common_laws = download_lois_dites(API_DIRECTORY)
-            if dos.get('legifrance_cidTexte') in common_laws and common_laws[dos['legifrance_cidTexte']].lower() not in dos['short_title'].lower():
-                dos['loi_dite'] = common_laws[dos['legifrance_cidTexte']]
+            if loi_dite and loi_dite.lower() not in dos['short_title'].lower():
+                dos['loi_dite'] = loi_dite
+
+            # the prefetched responses would all be in memory at the same time
+            if '--no-prefetch' not in sys.argv and not spill.enabled():
+                with timings.stage('prefetch'):
+                    prefetch_resources(dos, API_DIRECTORY)
 
             print('  [] parse the texts')
-            dos_with_texts = parse_doslegs_texts.process(dos)
+            with timings.stage('parse_texts'):
+                dos_with_texts = parse_doslegs_texts.process(dos)
 
             print('  [] format data for the frontend')
-            format_data_for_frontend.process(dos_with_texts, API_DIRECTORY, log=log)
+            with timings.stage('format_data'):
+                format_data_for_frontend.process(dos_with_texts, API_DIRECTORY, log=log)
+
+            timings.save(os.path.join(API_DIRECTORY, dos_with_texts['id'], 'timings.json'))
+
+            fingerprints.save(API_DIRECTORY, get_url_id(url), url, dos_with_texts['id'],
+                downloader.used_responses(), downloader.used_validators())
         except KeyboardInterrupt as e:
             raise e
         except Exception as e:
             # dump log for each failed doslegs in logs/
             dump_error_log(url, e, API_DIRECTORY, log)
             raise e
+        finally:
+            downloader.clear()
+            spill.clear()
 
 
 if __name__ == '__main__':
     args = [arg for arg in sys.argv[1:] if '--' not in arg]
     url = args[0]
     API_DIRECTORY = args[1] if len(args) > 1 else 'data'
+    downloader.install()
     process(API_DIRECTORY, url)
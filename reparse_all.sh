@@ -4,13 +4,13 @@ TODAY=$(date +%Y%m%d)
 DATADIR=data.$TODAY
 mkdir -p $DATADIR
 
-senapy-cli doslegs_urls | python parse_many.py $DATADIR --only-promulgated
+senapy-cli doslegs_urls | python parse_many.py $DATADIR --only-promulgated --reuse-from data --enable-parse-cache --http-cache --archive
 
 python generate_dossiers_csv.py $DATADIR
 
 python tools/assemble_procedures.py $DATADIR
 
-python tools/make_metrics_csv.py $DATADIR
+python tools/make_metrics_csv.py $DATADIR --enable-parse-cache
 
 python tools/steps_as_dot.py $DATADIR | dot -Tsvg > $DATADIR/steps.svg
 python tools/steps_as_dot.py $DATADIR | dot -Tpng > $DATADIR/steps.png
@@ -0,0 +1,199 @@
+"""
+Benchmark the parsing of a set of doslegs on recorded http responses
+
+Usage:
+    python tests/benchmark.py record <fixtures_directory> [dosleg ids...]
+    python tests/benchmark.py run <fixtures_directory> [--repeat N] [--threshold RATIO] [--save-baseline]
+
+`record` parses the doslegs while saving every http response in the fixtures
+directory. `run` parses them again without any network access, only from the
+fixtures, and compares the time spent in each stage with the baseline stored
+in <fixtures_directory>/baseline.json (it's created by the first run).
+
+Each run parses a dosleg in a new process with empty disk caches, so the
+caches kept in memory and on disk by a run don't make the next ones faster.
+
+The exit code is 1 if a stage is slower than the baseline by more than
+RATIO (default: 0.2) and more than MIN_DELTA seconds.
+"""
+import sys, os, json, glob, hashlib, pickle, shutil, subprocess, tempfile, time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from requests.adapters import HTTPAdapter
+
+import parse_one
+from tools import downloader, timings
+
+DEFAULT_DOSLEGS = ['pjl12-614', 'pjl11-497', 'pjl12-688', 'ppl09-682', 'pjl15-610']
+
+# the stages compared with the baseline
+STAGES = ['total', 'parse_texte', 'complete_articles', 'prepare_articles', 'prepare_amendements']
+
+# smaller differences are considered noise
+MIN_DELTA = 0.05
+
+# the directories of the disk caches, they are empty for each run
+CACHE_VARIABLES = ['LAWFACTORY_DOSLEG_CACHE', 'LAWFACTORY_PARSE_CACHE', 'LAWFACTORY_URL_RESOLUTIONS',
+    'LAWFACTORY_ARCHIVE', 'LAWFACTORY_HTTP_CACHE']
+
+
+class MissingFixture(Exception):
+    pass
+
+
+def get_option(name, default=None):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def fixture_path(fixtures_directory, request):
+    key = request.method + ' ' + downloader.store_key(request.url)
+    return os.path.join(fixtures_directory, 'responses', hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pickle')
+
+
+def record_responses(fixtures_directory):
+    os.makedirs(os.path.join(fixtures_directory, 'responses'), exist_ok=True)
+    send = HTTPAdapter.send
+
+    def recording_send(self, request, **kwargs):
+        resp = send(self, request, **kwargs)
+        resp.content  # load the body before pickling it
+        with open(fixture_path(fixtures_directory, request), 'wb') as f:
+            pickle.dump(resp, f)
+        return resp
+    HTTPAdapter.send = recording_send
+
+
+def replay_responses(fixtures_directory):
+    def replaying_send(self, request, **kwargs):
+        path = fixture_path(fixtures_directory, request)
+        if not os.path.exists(path):
+            raise MissingFixture('no recorded response for %s, record the fixtures again' % request.url)
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    HTTPAdapter.send = replaying_send
+
+
+def parse(dosleg_id):
+    """parse a dosleg in a temporary directory and returns its timings"""
+    api_directory = tempfile.mkdtemp(prefix='benchmark_')
+    try:
+        parse_one.process(api_directory, dosleg_id, only_log=True)
+        return timings.report()
+    finally:
+        shutil.rmtree(api_directory)
+
+
+def empty_caches_environ(cache_directory):
+    """the environment variables setting the disk caches in an empty directory"""
+    env = dict(os.environ)
+    for variable in CACHE_VARIABLES:
+        env[variable] = os.path.join(cache_directory, variable.lower())
+    env['LAWFACTORY_URL_RESOLUTIONS'] += '.sqlite'
+    return env
+
+
+def parse_in_new_process(fixtures_directory, dosleg_id):
+    """parse a dosleg from the fixtures in a new process with empty caches and returns its timings"""
+    cache_directory = tempfile.mkdtemp(prefix='benchmark_cache_')
+    try:
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), 'parse', fixtures_directory, dosleg_id],
+            env=empty_caches_environ(cache_directory))
+    finally:
+        shutil.rmtree(cache_directory)
+    # the timings are printed last
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def record(fixtures_directory, doslegs):
+    shutil.rmtree(os.path.join(fixtures_directory, 'responses'), ignore_errors=True)
+    record_responses(fixtures_directory)
+    # every response needed by a run with empty caches is recorded
+    cache_directory = tempfile.mkdtemp(prefix='benchmark_cache_')
+    os.environ.update(empty_caches_environ(cache_directory))
+    recorded = []
+    for dosleg_id in doslegs:
+        print('recording', dosleg_id)
+        try:
+            parse(dosleg_id)
+            recorded.append(dosleg_id)
+        except Exception as e:
+            print('  failed:', type(e).__name__, e)
+    shutil.rmtree(cache_directory)
+    with open(os.path.join(fixtures_directory, 'doslegs.json'), 'w') as f:
+        json.dump({
+            'doslegs': recorded,
+            'legifrance_proxy': os.getenv('LEGIFRANCE_PROXY'),
+        }, f, indent=2)
+    print(len(recorded), 'doslegs recorded,', len(glob.glob(os.path.join(fixtures_directory, 'responses', '*'))), 'responses')
+
+
+def run(fixtures_directory, repeat=3):
+    """returns {dosleg_id: {stage: seconds}} with the best time of `repeat` runs"""
+    with open(os.path.join(fixtures_directory, 'doslegs.json')) as f:
+        fixtures = json.load(f)
+    if fixtures.get('legifrance_proxy'):
+        # the urls are rewritten with it before the request
+        os.environ['LEGIFRANCE_PROXY'] = fixtures['legifrance_proxy']
+
+    results = {}
+    for dosleg_id in fixtures['doslegs']:
+        best = {}
+        for _ in range(repeat):
+            report = parse_in_new_process(fixtures_directory, dosleg_id)
+            stages = {name: stage['time'] for name, stage in report['stages'].items()}
+            stages['total'] = report['total']
+            for name in STAGES:
+                best[name] = min(best.get(name, float('inf')), stages.get(name, 0))
+        results[dosleg_id] = best
+        print('%-15s' % dosleg_id, ' '.join('%s: %.2fs' % (name, best[name]) for name in STAGES))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """print the regressions and returns how many there are"""
+    regressions = 0
+    for dosleg_id, stages in sorted(results.items()):
+        for name, seconds in sorted(stages.items()):
+            before = baseline.get(dosleg_id, {}).get(name)
+            if before is None:
+                continue
+            if seconds > before * (1 + threshold) and seconds - before > MIN_DELTA:
+                print('REGRESSION: %s %s %.2fs -> %.2fs (+%d%%)' % (dosleg_id, name, before, seconds,
+                    100 * (seconds - before) / before if before else 100))
+                regressions += 1
+    return regressions
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ('record', 'run', 'parse'):
+        print(__doc__)
+        sys.exit(1)
+    command, fixtures_directory = sys.argv[1:3]
+
+    if command == 'parse':
+        # one run of `run`, in its own process
+        replay_responses(fixtures_directory)
+        print(json.dumps(parse(sys.argv[3])))
+        sys.exit()
+
+    if command == 'record':
+        record(fixtures_directory, [arg for arg in sys.argv[3:] if not arg.startswith('--')] or DEFAULT_DOSLEGS)
+        sys.exit()
+
+    results = run(fixtures_directory, repeat=int(get_option('--repeat', 3)))
+    baseline_file = os.path.join(fixtures_directory, 'baseline.json')
+    if '--save-baseline' in sys.argv or not os.path.exists(baseline_file):
+        with open(baseline_file, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('baseline saved in', baseline_file)
+        sys.exit()
+
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, float(get_option('--threshold', 0.2)))
+    if regressions:
+        print(regressions, 'regressions')
+        sys.exit(1)
+    print('no regression')
@@ -0,0 +1,118 @@
+"""
+Benchmark and check the completion of the texts by complete_articles
+
+Usage:
+    python tests/benchmark_complete.py [--articles N] [--repeat N]
+    python tests/benchmark_complete.py <debug_directory>
+
+Without a directory, texts like the ones of a budget law are generated and
+completed, with N articles (default: 1500) and a quarter of them: the time
+per article should be about the same for both.
+
+With a directory, the completions dumped by `parse_one.py <dosleg> --debug`
+(the debug_complete_args_step_*.json files and their
+debug_completed_text_step_*.json) are done again and compared with the
+dumped ones. The exit code is 1 if one of them is different.
+"""
+import sys, os, glob, json, random, time, contextlib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.complete_articles import complete, regexps_cache_stats
+
+
+def get_option(name, default=None):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def generate(articles_count, definitif=False, seed=0):
+    """
+    a previous text and the current text modifying it, as complete() takes
+    them, a definitif text keeps all the articles which were not deleted
+    """
+    rand = random.Random(seed)
+    previous = [{'type': 'texte', 'id': 'pjl17-%d' % articles_count, 'depot': False}]
+    current = [{'type': 'texte', 'id': 'tas17-%d' % articles_count, 'definitif': definitif}]
+    for i in range(1, articles_count + 1):
+        if i % 20 == 1:
+            section = {'type': 'section', 'type_section': 'chapitre', 'id': 'C%d' % (i // 20 + 1),
+                'titre': 'Chapitre %d' % (i // 20 + 1)}
+            previous.append(section)
+            current.append(dict(section))
+        titre = str(i) if i % 7 else '%d bis' % (i - 1)
+        alineas = ['%s. - Alinea %d de l\'article %s.' % (num, n, titre) for n, num in enumerate(['I', 'II', 'III'])]
+        if definitif and rand.random() < 0.1:
+            previous.append({'type': 'article', 'titre': titre, 'statut': 'supprimé', 'section': section['id'],
+                'alineas': {}})
+            continue
+        previous.append({'type': 'article', 'titre': titre, 'statut': 'none', 'section': section['id'],
+            'alineas': {'%03d' % (n + 1): text for n, text in enumerate(alineas)}})
+
+        change = rand.random()
+        if change < 0.1 and not definitif:
+            # removed from the text, it's marked as deleted
+            continue
+        elif change < 0.2:
+            statut, alineas = 'conforme', ['(Non modifié)']
+        elif change < 0.4:
+            statut, alineas = 'none', ['I et II. - (Non modifié)', 'III. - Alinea modifié de l\'article %s.' % titre]
+        elif change < 0.45 and not definitif:
+            statut, alineas = 'none', ['(Supprimé)']
+        else:
+            statut, alineas = 'none', [text + ' modifié' for text in alineas]
+        if change > 0.98 and not definitif:
+            current.append({'type': 'dots'})
+        current.append({'type': 'article', 'titre': titre, 'statut': statut, 'section': section['id'],
+            'alineas': {'%03d' % (n + 1): text for n, text in enumerate(alineas)}})
+    return {'current': current, 'previous': previous, 'step': {}, 'table_concordance': {}}
+
+
+def benchmark(articles_count, repeat):
+    for definitif in (False, True):
+        for count in (articles_count // 4, articles_count):
+            args = generate(count, definitif)
+            times = []
+            for _ in range(repeat):
+                # without the warnings about the generated texts
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+                    start = time.perf_counter()
+                    complete(**args)
+                    times.append(time.perf_counter() - start)
+            print('%5d articles%s: %.3fs, %.3fms per article' % (count, ' (definitif)' if definitif else '',
+                min(times), 1000 * min(times) / count))
+    print('alineas regexps: %(compiled)d compiled, %(reused)d reused' % regexps_cache_stats())
+
+
+def check_dumped(directory):
+    """returns the number of completions which are not the dumped ones"""
+    different = 0
+    for args_path in sorted(glob.glob(os.path.join(directory, 'debug_complete_args_step_*.json'))):
+        completed_path = args_path.replace('debug_complete_args_step_', 'debug_completed_text_step_')
+        if not os.path.exists(completed_path):
+            continue
+        with open(args_path) as f:
+            args = json.load(f)
+        with open(completed_path) as f:
+            expected = json.load(f)
+        start = time.perf_counter()
+        completed = complete(**args)
+        elapsed = time.perf_counter() - start
+        # compared as they are dumped
+        if json.loads(json.dumps(completed)) != expected:
+            different += 1
+            print('DIFFERENT:', args_path)
+        else:
+            print('ok: %s (%d articles, %.3fs)' % (os.path.basename(args_path), len(completed), elapsed))
+    print('alineas regexps: %(compiled)d compiled, %(reused)d reused' % regexps_cache_stats())
+    return different
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')
+        and arg not in (get_option('--articles'), get_option('--repeat'))]
+    if args:
+        if check_dumped(args[0]):
+            sys.exit(1)
+    else:
+        benchmark(int(get_option('--articles', 1500)), int(get_option('--repeat', 3)))
@@ -0,0 +1,115 @@
+"""
+Parse texts with two html parsers and report the differences of their articles
+
+Usage:
+    python tests/compare_html_parsers.py <fixtures_directory> [--parsers html5lib,lxml]
+    python tests/compare_html_parsers.py <url or file>... [--parsers html5lib,lxml]
+
+With a fixtures directory recorded by tests/benchmark.py, all the texts of
+its responses are compared, without network access. The exit code is 1 if
+there's a difference.
+"""
+import sys, os, glob, pickle
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import parse_texte
+
+# only the first differences of a text are shown
+MAX_DIFFERENCES = 10
+
+
+def get_option(name, default=None):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def recorded_texts(fixtures_directory):
+    """the (url, response) of the recorded pages, in the order of their url"""
+    responses = []
+    for path in glob.glob(os.path.join(fixtures_directory, 'responses', '*.pickle')):
+        with open(path, 'rb') as f:
+            resp = pickle.load(f)
+        if resp.status_code == 200 and 'html' in resp.headers.get('Content-Type', ''):
+            responses.append((resp.url, resp))
+    return sorted(responses, key=lambda x: x[0])
+
+
+def safe_parse(url, resp, html_parser):
+    try:
+        return parse_texte.parse(url, resp=resp, html_parser=html_parser)
+    except Exception as e:
+        return '%s: %s' % (type(e).__name__, e)
+
+
+def describe(item):
+    if item.get('type') == 'article':
+        return 'article %s' % item.get('titre')
+    if item.get('type') == 'section':
+        return 'section %s' % item.get('id')
+    return item.get('type')
+
+
+def differences(reference, other):
+    """the differences of the articles, alineas and sections of two parsings"""
+    if isinstance(reference, str) or isinstance(other, str):
+        if reference != other:
+            yield 'parsing: %s != %s' % (reference if isinstance(reference, str) else 'ok',
+                other if isinstance(other, str) else 'ok')
+        return
+    if len(reference) != len(other):
+        yield '%d items != %d items' % (len(reference), len(other))
+    for ref, oth in zip(reference, other):
+        if describe(ref) != describe(oth):
+            yield '%s != %s' % (describe(ref), describe(oth))
+            continue
+        ref_alineas, oth_alineas = ref.get('alineas', {}), oth.get('alineas', {})
+        for key in sorted(set(ref_alineas) | set(oth_alineas)):
+            if ref_alineas.get(key) != oth_alineas.get(key):
+                yield '%s alinea %s: %r != %r' % (describe(ref), key, ref_alineas.get(key), oth_alineas.get(key))
+        for key in sorted((set(ref) | set(oth)) - {'alineas'}):
+            if ref.get(key) != oth.get(key):
+                yield '%s %s: %r != %r' % (describe(ref), key, ref.get(key), oth.get(key))
+
+
+def compare(texts, reference_parser, other_parser):
+    """print the differences and returns the number of texts which differ"""
+    different = compared = 0
+    for url, resp in texts:
+        reference = safe_parse(url, resp, reference_parser)
+        if not reference:
+            # not a text
+            continue
+        compared += 1
+        diffs = list(differences(reference, safe_parse(url, resp, other_parser)))
+        if diffs:
+            different += 1
+            print('DIFFERENT:', url)
+            for diff in diffs[:MAX_DIFFERENCES]:
+                print('   ', diff)
+            if len(diffs) > MAX_DIFFERENCES:
+                print('    ... %d more differences' % (len(diffs) - MAX_DIFFERENCES))
+    print('%d texts compared, %d different' % (compared, different))
+    return different
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--') and arg != get_option('--parsers')]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    reference_parser, other_parser = get_option('--parsers', 'html5lib,lxml').split(',')
+    for html_parser in (reference_parser, other_parser):
+        try:
+            parse_texte.check_html_parser(html_parser)
+        except ValueError as e:
+            print('ERROR:', e)
+            sys.exit(1)
+
+    if len(args) == 1 and os.path.isdir(args[0]):
+        texts = recorded_texts(args[0])
+    else:
+        texts = [(url, None) for url in args]
+
+    if compare(texts, reference_parser, other_parser):
+        sys.exit(1)
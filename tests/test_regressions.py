@@ -99,7 +99,8 @@ for directory in sorted(glob.glob(TEST_DIR + '/p*')):
     print()
 
     parse_one.process(OUTPUT_DIR, senat_id)
-    comp = filecmp.dircmp(directory, OUTPUT_DIR + '/' + senat_id)
+    # the timings change at each run
+    comp = filecmp.dircmp(directory, OUTPUT_DIR + '/' + senat_id, ignore=filecmp.DEFAULT_IGNORES + ['timings.json'])
     if _is_same_helper(comp):
         print()
         print('  -> test passed')
@@ -7,12 +7,15 @@ import urllib.parse
 import metslesliens
 try:
     from .common import open_json, print_json
+    from . import spill
 except:
     from common import open_json, print_json
+    import spill
 
 def process(dos):
     for step_i, step in enumerate(dos['steps']):
-        articles = step.get('articles_completed', step.get('articles'))
+        key = spill.texts_key(step)
+        articles = spill.get(step, key)
         if not articles:
             continue
 
@@ -33,6 +36,7 @@ def process(dos):
                                 # 'index': candidat['index'],
                             })
                             """
+        spill.store(step, key, articles)
     return dos
 
 
@@ -0,0 +1,162 @@
+"""
+Archive of the raw http responses, to parse the doslegs again without network
+
+With --archive, every response returned by the downloader is kept in
+cache/archive/ (or in $LAWFACTORY_ARCHIVE): the bodies are stored once,
+compressed and named by their hash, in blobs/, and each process appends the
+url, the fetch time and the hash of the responses it got to its own file in
+index/, so many processes can write to the archive at the same time.
+
+With --offline, the downloader serves the latest archived response of each
+url instead of using the network.
+
+Usage: python tools/archive.py stats|compact
+"""
+import glob, gzip, hashlib, json, os, socket, sys, threading, time
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_index = None
+_lock = threading.Lock()
+
+
+class NotArchived(Exception):
+    pass
+
+
+def recording():
+    return '--archive' in sys.argv
+
+
+def offline():
+    return '--offline' in sys.argv
+
+
+def archive_directory():
+    return os.getenv('LAWFACTORY_ARCHIVE') or os.path.join(ROOT_DIRECTORY, 'cache', 'archive')
+
+
+def blob_path(sha):
+    return os.path.join(archive_directory(), 'blobs', sha[:2], sha + '.gz')
+
+
+def index_files():
+    return sorted(glob.glob(os.path.join(archive_directory(), 'index', '*.jsonl')))
+
+
+def own_index_file():
+    # one file per process, lines appended by a single writer are never mixed
+    return os.path.join(archive_directory(), 'index', '%s-%d.jsonl' % (socket.gethostname(), os.getpid()))
+
+
+def write_blob(content):
+    sha = hashlib.sha256(content).hexdigest()
+    path = blob_path(sha)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmpfile = '%s.%d-%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with gzip.open(tmpfile, 'wb') as f:
+            f.write(content)
+        os.replace(tmpfile, path)
+    return sha
+
+
+def put(key, resp):
+    """archive the response of the url `key`"""
+    entry = {
+        'url': key,
+        'fetched': time.time(),
+        'sha': write_blob(resp.content),
+        'status': resp.status_code,
+        'final_url': resp.url,
+        'encoding': resp.encoding,
+        'headers': dict(resp.headers),
+    }
+    path = own_index_file()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _lock, open(path, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+def read_index():
+    """returns {url: latest entry}"""
+    index = {}
+    for path in index_files():
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line of a process which was killed
+                    continue
+                if entry['url'] not in index or index[entry['url']]['fetched'] <= entry['fetched']:
+                    index[entry['url']] = entry
+    return index
+
+
+def get(key):
+    """the latest archived response of the url `key`, as it was downloaded"""
+    global _index
+    if _index is None:
+        _index = read_index()
+    entry = _index.get(key)
+    if entry is None:
+        raise NotArchived('%s is not in the archive %s' % (key, archive_directory()))
+    resp = Response()
+    with gzip.open(blob_path(entry['sha']), 'rb') as f:
+        resp._content = f.read()
+    resp.status_code = entry['status']
+    resp.url = entry['final_url']
+    resp.encoding = entry['encoding']
+    resp.headers = CaseInsensitiveDict(entry['headers'])
+    return resp
+
+
+def compact():
+    """merge the index files in one, keeping only the changes of each url"""
+    entries = []
+    for path in index_files():
+        with open(path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    entries.sort(key=lambda entry: entry['fetched'])
+    kept = []
+    last_sha = {}
+    for entry in entries:
+        if last_sha.get(entry['url']) != (entry['sha'], entry['status']):
+            last_sha[entry['url']] = (entry['sha'], entry['status'])
+            kept.append(entry)
+    merged = os.path.join(archive_directory(), 'index', 'compacted-%d.jsonl' % time.time())
+    tmpfile = merged + '.tmp'
+    with open(tmpfile, 'w') as f:
+        for entry in kept:
+            f.write(json.dumps(entry) + '\n')
+    old_files = index_files()
+    os.replace(tmpfile, merged)
+    for path in old_files:
+        os.remove(path)
+    return len(entries), len(kept)
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    if command == 'stats':
+        index = read_index()
+        blobs = glob.glob(os.path.join(archive_directory(), 'blobs', '*', '*.gz'))
+        print('archive:', archive_directory())
+        print('urls:', len(index))
+        print('index files:', len(index_files()))
+        print('bodies: %d (%.1f MB)' % (len(blobs), sum(os.path.getsize(path) for path in blobs) / 1024 / 1024))
+    elif command == 'compact':
+        # the processes writing in the archive must be stopped
+        before, after = compact()
+        print('compacted %d entries in %d' % (before, after))
+    else:
+        print(__doc__)
+        sys.exit(1)
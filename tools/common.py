@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import sys, os, re, requests
+import sys, os, re
 from datetime import date, datetime
 from html.entities import name2codepoint
 from csv import DictReader
@@ -12,8 +12,14 @@ import locale
 locale.setlocale(locale.LC_TIME, 'fr_FR.utf8')
 try:
     from .sort_articles import bister
+    from .downloader import download
+    from . import reference_data
+    from .reference_data import slug_groupe
 except:
     from sort_articles import bister
+    from downloader import download
+    import reference_data
+    from reference_data import slug_groupe
 
 
 def open_csv(dirpath, filename, delimiter=";"):
@@ -46,12 +52,12 @@ def open_json(dirpath, filename=None):
 def print_json(dico, filename=None):
     jdump = json.dumps(dico, ensure_ascii=False, sort_keys=True, indent=2)
     if filename:
+        # the pid avoids clashes between parallel workers writing the same file
+        tmpfile = "%s.%d.tmp" % (filename, os.getpid())
         try:
-            with open("%s.tmp" % filename, 'w') as f:
+            with open(tmpfile, 'w') as f:
                 f.write(jdump)
-            if os.path.exists(filename):
-                os.remove(filename)
-            os.rename("%s.tmp" % filename, filename)
+            os.replace(tmpfile, filename)
         except Exception as e:
             print(type(e), e, file=sys.stderr)
             sys.stderr.write("ERROR: Could not write in file %s" % filename)
@@ -180,14 +186,6 @@ photo_link = lambda obj, urlapi: personalize_link("https://##URLAPI##.fr/##TYPE#
 groupe_link = lambda obj, urlapi: personalize_link("https://##URLAPI##.fr/groupe/##SLUG##", obj, urlapi)
 amdapi_link = lambda urlapi: personalize_link("https://##URLAPI##.fr/api/document/Amendement/", {'slug': 'na'}, urlapi)
 
-def slug_groupe(g):
-    g = g.upper()
-    g = g.replace("SOCV", "SOC")
-    g = g.replace("CRC-SPG", "CRC")
-    g = g.replace("ECOLO", "ECO")
-    g = g.replace("ECO", "ECOLO")
-    return g
-
 class Context(object):
 
     def __init__(self, sysargs, load_parls=False):
@@ -196,11 +194,12 @@ class Context(object):
         if not self.sourcedir:
             sys.stderr.write('ERROR: no input directory given\n')
             exit(1)
-        self.allgroupes = {}
-        self.get_groupes()
-        self.parlementaires = {}
-        if load_parls:
-            self.get_parlementaires()
+        # the parent directory is found without requiring sourcedir to exist yet
+        self.api_directory = os.path.normpath(os.path.join(self.sourcedir, '..'))
+        # loaded once per process and shared by all the contexts
+        data = reference_data.get(self.api_directory, download_missing=False)
+        self.allgroupes = reference_data.get_groupes(self.api_directory)
+        self.parlementaires = data['parlementaires'] if load_parls else {}
 
     def get_procedure(self):
         try:
@@ -210,49 +209,8 @@ class Context(object):
             sys.stderr.write('ERROR: could not find procedure data in directory %s\n' % self.sourcedir)
             raise e
 
-    def get_parlementaires(self):
-        for f in os.listdir(os.path.join(self.sourcedir, '..')):
-            if f.endswith('.parlementaires.json'):
-                url = f.replace('.parlementaires.json', '').lower()
-                try:
-                    with open(os.path.join(self.sourcedir, '..', f), "r") as parls:
-                        self.parlementaires[url] = {}
-                        typeparl = "depute" if "depute" in url else "senateur"
-                        for parl in json.load(parls)[typeparl+"s"]:
-                            p = parl[typeparl]
-                            self.parlementaires[url][p["slug"]] = p
-                except Exception as e:
-                    sys.stderr.write('WARNING: could not read parlementaires file %s in data\n' % f)
-                    sys.stderr.write('%s: %s\n' % (type(e), e))
-
     def get_parlementaire(self, urlapi, slug):
-        try:
-            return self.parlementaires[urlapi][slug]
-        except:
-            typeparl = "depute" if "deputes" in urlapi else "senateur"
-            if urlapi not in self.parlementaires:
-                self.parlementaires[urlapi] = {}
-            self.parlementaires[urlapi][slug] = requests.get(parl_link(slug, urlapi)+"/json").json()[typeparl]
-            return self.parlementaires[urlapi][slug]
-
-    def get_groupes(self):
-        for f in os.listdir(os.path.join(self.sourcedir, '..')):
-            if f.endswith('-groupes.json'):
-                url = f.replace('-groupes.json', '').lower()
-                try:
-                    with open(os.path.join(self.sourcedir, '..', f), "r") as gpes:
-                        self.allgroupes[url] = {}
-                        for gpe in json.load(gpes)['organismes']:
-                            if not gpe["organisme"]["acronyme"]:
-                                continue
-                            acro = slug_groupe(gpe["organisme"]["acronyme"])
-                            self.allgroupes[url][acro] = {
-                                "nom": gpe["organisme"]['nom'],
-                                "order": int(gpe["organisme"]['order']),
-                                "color": "rgb(%s)" % gpe["organisme"]['couleur']}
-                except Exception as e:
-                    sys.stderr.write('WARNING: could not read groupes file %s in data\n' % f)
-                    sys.stderr.write('%s: %s\n' % (type(e), e))
+        return reference_data.get_parlementaire(self.api_directory, urlapi, slug)
 
     def add_groupe(self, groupes, gpe, urlapi):
         gpid = upper_first(gpe.lower())
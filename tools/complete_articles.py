@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import sys, re, copy
+import sys, re
+from collections import Counter, deque
+from functools import lru_cache
 
 from requests.structures import CaseInsensitiveDict
 
@@ -13,9 +15,81 @@ except SystemError:
     from common import clean_text_for_diff, compute_similarity, open_json, print_json
 
 
+find_num = re.compile(r'-[a-z]*(\d+)\D?$')
+null_reg = re.compile(r'^$')
+re_mat_simple = re.compile(r'[IVXDCLM\d]')
+re_mat_complex = re.compile(r'L[O.\s]*[IVXDCLM\d]')
+re_mat_complex2 = re.compile(r'\d+-\d+')
+re_clean_art = re.compile(r'^"?Art\.?\s*', re.I)
+re_sect_chg = re.compile(r'^((chap|t)itre|volume|livre|tome|(sous-)?section)\s+[1-9IVXDC]', re.I)
+re_clean_et = re.compile(r'(\s*[\&,]\s*|\s+et\s+)+', re.I)
+re_suppr = re.compile(r'\W*suppr(ess|im)', re.I)
+re_confo = re.compile(r'\W*(conforme|non[\s\-]*modifi)', re.I)
+re_confo_with_txt = re.compile(r'\s*\(\s*(conforme|non[\s\-]*modifié)\s*\)\s*([\W]*\w+)', re.I)
+re_clean_subsec_space = re.compile(r'^("?[IVX0-9]{1,4}(\s+[a-z]+)?(\s+[A-Z]{1,4})?)\s*([\.°\-]+)\s*([^\s\)])', re.I)
+re_non_modifie = re.compile(r'\s*([\.°\-]+\s*)+\s*\(Non')
+
+# the regexps of the start and the end of the parts of the alineas, the same
+# ones are used by all the steps of a bill
+REGEXPS_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=REGEXPS_CACHE_SIZE)
+def make_sta_reg(x):
+    return re.compile(r'^("?Art[\s\.]*)?%s\s*(([\.°\-]+\s*)+)' % re_clean_art.sub('', x))
+
+
+@lru_cache(maxsize=REGEXPS_CACHE_SIZE)
+def make_end_reg(x, rich):
+    return re.compile(r'^%s[IVXDCLM\d\-]+([\-\.\s]+\d*)*((%s|[A-Z])\s*)*(\(|et\s|%s)' % ('("?[LA][LArRtTO\.\s]+)?' if rich else "", bister, x))
+
+
+def regexps_cache_stats():
+    """the number of regexps compiled and reused by make_sta_reg and make_end_reg"""
+    stats = {'compiled': 0, 'reused': 0}
+    for function in (make_sta_reg, make_end_reg):
+        info = function.cache_info()
+        stats['compiled'] += info.misses
+        stats['reused'] += info.hits
+    return stats
+
+
+class ArticleIds:
+    """
+    the titles of the old articles not yet matched, a list where `in` and
+    `remove` don't need to look through the list
+    """
+
+    def __init__(self, titres):
+        self.titres = titres
+        self.left = Counter(titres)
+        self.removed = Counter()
+
+    def __contains__(self, titre):
+        return self.left.get(titre, 0) > 0
+
+    def remove(self, titre):
+        if titre not in self:
+            raise ValueError('%s not in the articles' % titre)
+        self.left[titre] -= 1
+        self.removed[titre] += 1
+
+    def as_list(self):
+        # like list.remove, the first occurrences are the removed ones
+        skipped = Counter()
+        left = []
+        for titre in self.titres:
+            if skipped[titre] < self.removed[titre]:
+                skipped[titre] += 1
+            else:
+                left.append(titre)
+        return left
+
+
 def complete(current, previous, step, table_concordance, anteprevious=None):
-    current = copy.deepcopy(current)
-    previous = copy.deepcopy(previous)
+    # the inputs are not modified, the lines which are changed are copied
+    # first, their alineas are replaced and never modified
+    previous = [dict(line) for line in previous]
     table_concordance = CaseInsensitiveDict(table_concordance)
 
     DEBUG = '--debug' in sys.argv
@@ -26,14 +100,13 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
     def exit():
         raise Exception('[complete_articles] Fatal error')
 
-    find_num = re.compile(r'-[a-z]*(\d+)\D?$')
     oldnum = 0
     oldstep = {}
     oldjson = []
     oldstatus = {}
     oldartids = []
-    oldarts = []
-    oldsects = []
+    oldarts = deque()
+    oldsects = deque()
     try:
         for line in previous:
             if line["type"] != "texte":
@@ -54,6 +127,7 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
         print(type(e), e, file=sys.stderr)
         log("No previous step found at %s" % sys.argv[2])
         exit()
+    oldartids = ArticleIds(oldartids)
 
     gdoldstep = None
     if anteprevious:
@@ -69,14 +143,6 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
         nonlocal ALL_ARTICLES
         ALL_ARTICLES.append(data)
 
-    null_reg = re.compile(r'^$')
-    re_mat_simple = re.compile(r'[IVXDCLM\d]')
-    re_mat_complex = re.compile(r'L[O.\s]*[IVXDCLM\d]')
-    re_mat_complex2 = re.compile(r'\d+-\d+')
-    re_clean_art = re.compile(r'^"?Art\.?\s*', re.I)
-    make_sta_reg = lambda x: re.compile(r'^("?Art[\s\.]*)?%s\s*(([\.°\-]+\s*)+)' % re_clean_art.sub('', x))
-    make_end_reg = lambda x, rich: re.compile(r'^%s[IVXDCLM\d\-]+([\-\.\s]+\d*)*((%s|[A-Z])\s*)*(\(|et\s|%s)' % ('("?[LA][LArRtTO\.\s]+)?' if rich else "", bister, x))
-    re_sect_chg = re.compile(r'^((chap|t)itre|volume|livre|tome|(sous-)?section)\s+[1-9IVXDC]', re.I)
     def get_mark_from_last(text, s, l="", sep="", enable_copyall=False, copyall=False):
         log("- GET Extract from " + s + " to " + l)
         res = []
@@ -85,7 +151,7 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
         except Exception as e:
             print('ERROR', type(e), e, s, l, file=sys.stderr)
             exit()
-        rich = re_mat_complex.match(s) or re_mat_complex2.match(s) or not re_mat_simple.match(s)
+        rich = bool(re_mat_complex.match(s) or re_mat_complex2.match(s) or not re_mat_simple.match(s))
         if l:
             last = make_sta_reg(l)
         re_end = None
@@ -128,16 +194,15 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
 
     get_alineas_text = lambda a: clean_text_for_diff([a[k] for k in sorted(a.keys())])
 
-    re_clean_et = re.compile(r'(\s*[\&,]\s*|\s+et\s+)+', re.I)
-    re_suppr = re.compile(r'\W*suppr(ess|im)', re.I)
-    re_confo = re.compile(r'\W*(conforme|non[\s\-]*modifi)', re.I)
-    re_confo_with_txt = re.compile(r'\s*\(\s*(conforme|non[\s\-]*modifié)\s*\)\s*([\W]*\w+)', re.I)
-    re_clean_subsec_space = re.compile(r'^("?[IVX0-9]{1,4}(\s+[a-z]+)?(\s+[A-Z]{1,4})?)\s*([\.°\-]+)\s*([^\s\)])', re.I)
     order = 1
     cursec = {'id': ''}
     done_titre = False
     texte = None
+    # if the last of the previous dots and articles were some dots
+    last_block_was_dots_and_not_an_article = False
     for line_i, line in enumerate(current):
+        if line_i and current[line_i - 1]['type'] in ('dots', 'article'):
+            last_block_was_dots_and_not_an_article = current[line_i - 1]['type'] == 'dots'
         if not line or not "type" in line:
             sys.stderr.write("JSON badly formatted, missing field type: %s\n" % line)
             exit()
@@ -159,10 +224,11 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
           if not done_titre:
             write_json(texte)
             done_titre = True
+          line = dict(line)
           if line["type"] != "article":
             if texte['definitif']:
                 try:
-                    cursec = oldsects.pop(0)
+                    cursec = oldsects.popleft()
                     assert(cursec["type_section"] == line["type_section"])
                 except:
                     print("ERROR: Problem while renumbering sections: ", line['titre'], " is not ", cursec, '\n', file=sys.stderr)
@@ -205,7 +271,7 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
                         if oldart['titre'].lower() in table_concordance:
                             new_art = table_concordance[oldart['titre']]
                             if 'suppr' in new_art:
-                                c, a = oldarts.pop(0)
+                                c, a = oldarts.popleft()
                                 oldartids.remove(c)
                                 if olddepot:
                                     log("DEBUG: Marking art %s as supprimé (thanks to concordance table)" % c)
@@ -216,7 +282,7 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
 
                         # as a backup, use the detected status to wait for a non-deleted article
                         if re_suppr.match(oldart['statut']):
-                            c, a = oldarts.pop(0)
+                            c, a = oldarts.popleft()
                             oldartids.remove(c)
                             if olddepot:
                                 log("DEBUG: Marking art %s as supprimé (recovered)" % c)
@@ -281,11 +347,11 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
 
             if oldarts:
                 while oldarts:
-                    cur, a = oldarts.pop(0)
+                    cur, a = oldarts[0]
                     if line['titre'] in oldartids or article_is_lower(cur, line['titre']):
+                        oldarts.popleft()
                         oldartids.remove(cur)
                     else:
-                        oldarts.insert(0, (cur, a))
                         break
                     if cur == line['titre']:
                         break
@@ -299,13 +365,6 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
                     elif not re_suppr.match(a["statut"]):
                         # if the last line of text was some dots, it means that we should keep
                         # the articles as-is if they are not deleted
-                        last_block_was_dots_and_not_an_article = False
-                        for block in reversed(current[:line_i]):
-                            if block['type'] == 'dots':
-                                last_block_was_dots_and_not_an_article = True
-                                break
-                            if block['type'] == 'article':
-                                break
                         if last_block_was_dots_and_not_an_article:
                             # ex: https://www.senat.fr/leg/ppl09-304.html
                             log("DEBUG: Recovering art as non-modifié via dots %s" % cur)
@@ -343,7 +402,7 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
                         write_json(a)
                     if cur == ed or not oldarts:
                         break
-                    cur, a = oldarts.pop(0)
+                    cur, a = oldarts.popleft()
                 continue
             if (re_suppr.match(line["statut"]) or (len(alineas) == 1 and re_suppr.match(alineas[0]))) and (line['titre'] not in oldstatus or re_suppr.match(oldstatus[line['titre']])):
                continue
@@ -366,7 +425,7 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
                     text = re_clean_subsec_space.sub(r'\1\4 \5', text)
                     gd_text.append(text)
                 elif "(Non modifi" in text:
-                    part = re.split("\s*([\.°\-]+\s*)+\s*\(Non", text)
+                    part = re_non_modifie.split(text)
                     if not part:
                         log("ERROR trying to get non-modifiés")
                         exit()
@@ -376,8 +435,8 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
                     for todo in pieces.split(','):
                         # Extract series of non-modified subsections of articles from previous version.
                         if " à " in todo:
-                            start = re.split(" à ", todo)[0]
-                            end = re.split(" à ", todo)[1]
+                            start = todo.split(" à ")[0]
+                            end = todo.split(" à ")[1]
                             mark = get_mark_from_last(oldstep[line['titre']], start, end, sep=part[1:], enable_copyall=enable_copyall)
                             if mark is False and gdoldstep:
                                 mark = get_mark_from_last(gdoldstep[line['titre']], start, end, sep=part[1:], enable_copyall=enable_copyall)
@@ -405,14 +464,14 @@ def complete(current, previous, step, table_concordance, anteprevious=None):
             write_json(line)
 
     if texte['definitif'] and oldsects and oldarts:
-        print("ERROR: %s sections left:\n%s" % (len(oldsects), oldsects), file=sys.stderr)
+        print("ERROR: %s sections left:\n%s" % (len(oldsects), list(oldsects)), file=sys.stderr)
         #exit()
 
     while oldarts:
-        cur, a = oldarts.pop(0)
+        cur, a = oldarts.popleft()
         oldartids.remove(cur)
         if texte['definitif'] and not re_suppr.match(a["statut"]):
-            print("ERROR: %s articles left:\n%s %s" % (len(oldarts)+1, cur, oldartids), file=sys.stderr)
+            print("ERROR: %s articles left:\n%s %s" % (len(oldarts)+1, cur, oldartids.as_list()), file=sys.stderr)
             exit()
 
         if not texte.get('echec', '') and a["statut"].startswith("conforme"):
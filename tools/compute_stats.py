@@ -3,6 +3,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from common import strip_text, compute_similarity_by_articles, open_json, print_json, \
     clean_text_for_diff, datize
+from spill import load
 
 
 def find_amendements(path):
@@ -14,7 +15,7 @@ def find_amendements(path):
 
 
 def read_text(step):
-    articles = step['texte.json']['articles']
+    articles = load(step['texte.json'])['articles']
     texte = ''
     for art in articles:
         for key in sorted(art['alineas'].keys()):
@@ -24,7 +25,7 @@ def read_text(step):
 
 
 def read_articles(step):
-    articles = step['texte.json']['articles']
+    articles = load(step['texte.json'])['articles']
     return {art['titre']: clean_text_for_diff([art['alineas'][al] for al in sorted(art['alineas'].keys())]) for art in articles}
 
 
@@ -0,0 +1,163 @@
+"""
+Cache of the dosleg pages parsed by senapy and anpy
+
+A dosleg page is parsed at most once per version of its content: the parsed
+structure is kept by the hash of the page, its url, the options, the code
+of the parser and the installed versions of senapy, anpy and
+lawfactory_utils, in memory for the whole process and, with
+--enable-parse-cache, on disk in cache/doslegs/ (or in
+$LAWFACTORY_DOSLEG_CACHE) for DISK_TTL.
+
+What the parser printed or logged is kept with the structure and printed
+again when it's reused, so the logs of a dosleg don't depend on the cache.
+
+The pages the parsers download by themselves (the concordance tables) are not
+part of the key, a change of them is seen once the entry expired.
+`python tools/dosleg_cache.py purge` removes all the entries, `expire` the
+expired ones.
+
+Usage: python tools/dosleg_cache.py stats|purge|expire
+"""
+import copy, glob, gzip, hashlib, os, pickle, sys, threading, time
+from collections import OrderedDict
+
+try:
+    from . import downloader, fingerprints, log_capture, parse_cache
+except ImportError:
+    import downloader, fingerprints, log_capture, parse_cache
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEMORY_CACHE_SIZE = 256
+DISK_TTL = 7 * 86400
+
+_parsed = OrderedDict()
+_versions = {}
+_lock = threading.Lock()
+
+
+def cache_directory():
+    return os.getenv('LAWFACTORY_DOSLEG_CACHE') or os.path.join(ROOT_DIRECTORY, 'cache', 'doslegs')
+
+
+def entry_path(key):
+    return os.path.join(cache_directory(), key[:2], key + '.pickle.gz')
+
+
+def all_entries():
+    return glob.glob(os.path.join(cache_directory(), '*', '*.pickle.gz'))
+
+
+def expired_entries():
+    return [path for path in all_entries() if os.path.getmtime(path) + DISK_TTL < time.time()]
+
+
+def parser_version(parser):
+    """hash of the code of the module of the parser and of the versions of the libraries"""
+    name = parser.__module__ + '.' + parser.__name__
+    if name not in _versions:
+        sha = hashlib.sha1(name.encode('utf-8'))
+        sha.update(fingerprints.libraries_version().encode('utf-8'))
+        path = getattr(sys.modules.get(parser.__module__), '__file__', None)
+        if path:
+            with open(path, 'rb') as f:
+                sha.update(f.read())
+        _versions[name] = sha.hexdigest()
+    return _versions[name]
+
+
+def key(parser, html, url, options):
+    sha = hashlib.sha1(parser_version(parser).encode('utf-8'))
+    sha.update(repr((url, sorted(options.items()))).encode('utf-8'))
+    sha.update(b'\0')
+    sha.update(html.encode('utf-8'))
+    return sha.hexdigest()
+
+
+def get(key):
+    """returns (events, parsed) or None"""
+    with _lock:
+        if key in _parsed:
+            _parsed.move_to_end(key)
+            return _parsed[key]
+    if parse_cache.enabled():
+        path = entry_path(key)
+        try:
+            if os.path.getmtime(path) + DISK_TTL < time.time():
+                return None
+            with gzip.open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        remember(key, entry)
+        return entry
+
+
+def remember(key, entry):
+    with _lock:
+        _parsed[key] = entry
+        while len(_parsed) > MEMORY_CACHE_SIZE:
+            _parsed.popitem(last=False)
+
+
+def put(key, entry):
+    remember(key, entry)
+    if parse_cache.enabled():
+        path = entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmpfile = '%s.%d-%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with gzip.open(tmpfile, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfile, path)
+
+
+def cached_parse(parser, html, url, logfile, **options):
+    """`parser(html, url, logfile=logfile, **options)`, parsed once per version of the page"""
+    entry_key = key(parser, html, url, options)
+    entry = get(entry_key)
+    if entry is not None:
+        events, parsed = entry
+        log_capture.replay(events, log=logfile)
+        return copy.deepcopy(parsed)
+
+    events = []
+    try:
+        with log_capture.capture(events):
+            parsed = parser(html, url, logfile=log_capture.Recorder(events, 'log'), **options)
+    finally:
+        log_capture.replay(events, log=logfile)
+    put(entry_key, (events, copy.deepcopy(parsed)))
+    return parsed
+
+
+# senapy and anpy are imported here, only the parsing of the doslegs needs them
+def parse_senat(html, url, logfile=None):
+    from senapy.dosleg.parser import parse as senapy_parse
+    downloader.route_lawfactory_downloads()
+    # senapy logs to the stderr of the process by default
+    return cached_parse(senapy_parse, html, url, logfile or sys.__stderr__)
+
+
+def parse_an(html, url, logfile=None, verbose=True):
+    from anpy.dossier_like_senapy import parse as anpy_parse
+    downloader.route_lawfactory_downloads()
+    return cached_parse(anpy_parse, html, url, logfile or sys.__stderr__, verbose=verbose)
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    if command == 'stats':
+        entries = all_entries()
+        print('directory:', cache_directory())
+        print('entries:', len(entries))
+        print('expired entries:', len(expired_entries()))
+        print('size: %.1f MB' % (sum(os.path.getsize(path) for path in entries) / 1024 / 1024))
+    elif command == 'purge':
+        for path in all_entries():
+            os.remove(path)
+    elif command == 'expire':
+        for path in expired_entries():
+            os.remove(path)
+    else:
+        print(__doc__)
+        sys.exit(1)
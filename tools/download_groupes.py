@@ -1,9 +1,22 @@
 import sys, os, time
 
-from lawfactory_utils.urls import download, enable_requests_cache
+from lawfactory_utils.urls import enable_requests_cache
 
+try:
+    from .downloader import fetch
+except ImportError:
+    from downloader import fetch
 
-def process(output_directory):
+
+def write_file(destfile, content):
+    # written aside then moved so other workers never read a partial file
+    tmpfile = "%s.%d.tmp" % (destfile, os.getpid())
+    with open(tmpfile, 'w') as f:
+        f.write(content)
+    os.replace(tmpfile, destfile)
+
+
+def process(output_directory, verbose=True):
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
     yesterday = time.time() - 86400
@@ -11,13 +24,15 @@ def process(output_directory):
         dfile = '%s-groupes.json' % url
         destfile = os.path.join(output_directory, dfile)
         if not os.path.exists(destfile) or os.path.getmtime(destfile) < yesterday:
-            print('downloading', dfile)
-            open(destfile, 'w').write(download("https://%s.fr/organismes/groupe/json" % url).text)
+            if verbose:
+                print('downloading', dfile)
+            write_file(destfile, fetch("https://%s.fr/organismes/groupe/json" % url).text)
         dfile = '%s.parlementaires.json' % url
         destfile = os.path.join(output_directory, dfile)
         if not os.path.exists(destfile) or os.path.getmtime(destfile) < yesterday:
-            print('downloading', dfile)
-            open(destfile, 'w').write(download("http://%s.fr/%s/json" %
+            if verbose:
+                print('downloading', dfile)
+            write_file(destfile, fetch("http://%s.fr/%s/json" %
                 (url, 'deputes' if 'deputes' in url else 'senateurs')).text)
 
 
@@ -0,0 +1,459 @@
+"""
+Single entry point for all the downloads of the pipeline
+
+`fetch()` is the http client: the connections are kept alive in a shared
+session, each host has a rate limit (token bucket) and a concurrency limit
+which is halved when the host answers slowly or fails and grows back slowly
+when it's fast again (AIMD). Identical requests made at the same time by
+several threads are only sent once. Like lawfactory_utils' download, it uses
+the requests cache when it's enabled and the legifrance proxy.
+
+With --http-cache, the responses are kept in cache/http/ (or in
+$LAWFACTORY_HTTP_CACHE) with their ETag and Last-Modified headers. A cached
+response is used as is while it's fresh according to FRESHNESS, then it's
+revalidated with If-None-Match/If-Modified-Since so only the pages which
+changed are downloaded again. After `freeze()` (the dosleg is promulgated),
+the cached documents of the dosleg are fresh, the reference data shared by
+all the doslegs is still revalidated.
+
+Responses fetched in advance with `prefetch()` are kept in a warm store
+and served by `download()` until `clear()` is called, so the later stages
+don't wait for the network.
+
+The hash of every response returned by `download()` is also kept until
+`clear()`, with its ETag and Last-Modified, it's the fingerprint of the
+inputs of a dosleg. `is_modified()` asks a server if a page changed since
+then without downloading it again.
+
+With --archive, the responses are also kept in the archive (see archive.py),
+with --offline they are only read from it.
+
+Once `install()` is called by the entry points of the pipeline (parse_one.py,
+parse_many.py), lawfactory_utils' download is replaced by `download()`, so the
+pages that senapy, anpy and lawfactory_utils download by themselves
+(redirections, concordance tables,...) go through the same cache and archive.
+Importing this module changes nothing.
+"""
+import hashlib
+import os
+import pickle
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests import ConnectionError, HTTPError
+from requests.adapters import HTTPAdapter
+from lawfactory_utils import urls as lawfactory_urls
+
+try:
+    from . import archive, timings
+except ImportError:
+    import archive, timings
+
+
+USER_AGENT = 'https://github.com/regardscitoyens/the-law-factory-parser (Compat: Mozilla)'
+
+MAX_CONNECTIONS = 16
+MAX_CONNECTIONS_PER_HOST = 4
+
+# (requests per second, burst) for each host
+RATE_LIMITS = {
+    'www.senat.fr': (5, 10),
+    'www.nosdeputes.fr': (5, 10),
+    'www.nossenateurs.fr': (5, 10),
+}
+DEFAULT_RATE_LIMIT = (10, 20)
+
+# a response slower than this (in seconds) halves the concurrency of its host
+SLOW_RESPONSE = 10
+RETRIES = 5
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FROZEN = float('inf')
+re_reference_data = re.compile(r'\.fr/organismes/groupe/json|\.fr/(deputes|senateurs)/json')
+# (url regex, seconds during which a cached response is used without revalidating it)
+# the other urls are always revalidated
+FRESHNESS = [
+    (re_reference_data, 86400),
+    # published texts and decisions
+    (re.compile(r'legifrance\.gouv\.fr|conseil-constitutionnel\.fr'), FROZEN),
+]
+
+_warm_store = {}
+_used_responses = {}
+_used_validators = {}
+# the urls which are not revalidated after `freeze()`
+_frozen = None
+
+re_cache_busting = re.compile(r'([?&])cache=[^&]*&?')
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ConcurrencyLimit:
+    """additive increase after a fast response, multiplicative decrease after a slow one"""
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.active = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= int(self.limit):
+                self.condition.wait()
+            self.active += 1
+
+    def release(self, slow=False):
+        with self.condition:
+            self.active -= 1
+            if slow:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class Host:
+    def __init__(self, netloc):
+        self.bucket = TokenBucket(*RATE_LIMITS.get(netloc, DEFAULT_RATE_LIMIT))
+        self.concurrency = ConcurrencyLimit(MAX_CONNECTIONS_PER_HOST)
+
+
+_hosts = {}
+_in_flight = {}
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def get_host(url):
+    netloc = urlparse(url).netloc
+    with _lock:
+        if netloc not in _hosts:
+            _hosts[netloc] = Host(netloc)
+        return _hosts[netloc]
+
+
+def session():
+    global _session, _session_pid
+    with _lock:
+        # a forked worker must not share the connections of its parent
+        if _session is None or _session_pid != os.getpid():
+            _session_pid = os.getpid()
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_CONNECTIONS, pool_maxsize=MAX_CONNECTIONS_PER_HOST)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _session.headers['User-Agent'] = USER_AGENT
+        return _session
+
+
+def cache_file(url):
+    # same file as lawfactory_utils so both share the requests cache
+    return os.path.join(lawfactory_urls.cache_directory(), hashlib.sha224(url.encode('utf-8')).hexdigest())
+
+
+def http_cache_enabled():
+    return '--http-cache' in sys.argv
+
+
+def http_cache_file(url):
+    directory = os.getenv('LAWFACTORY_HTTP_CACHE') or os.path.join(ROOT_DIRECTORY, 'cache', 'http')
+    return os.path.join(directory, hashlib.sha224(store_key(url).encode('utf-8')).hexdigest())
+
+
+def read_http_cache(url):
+    try:
+        with open(http_cache_file(url), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def write_http_cache(url, entry):
+    path = http_cache_file(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpfile = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmpfile, 'wb') as f:
+        pickle.dump(entry, f)
+    os.replace(tmpfile, path)
+
+
+def is_dosleg_document(url):
+    return not re_reference_data.search(url)
+
+
+def freeze(is_frozen=is_dosleg_document):
+    """the documents of the dosleg won't change anymore, the urls for which `is_frozen(url)` are not revalidated"""
+    global _frozen
+    _frozen = is_frozen
+
+
+def freshness(url):
+    if _frozen and _frozen(url):
+        return FROZEN
+    for regex, seconds in FRESHNESS:
+        if regex.search(url):
+            return seconds
+    return 0
+
+
+def _get(url, headers=None):
+    host = get_host(url)
+    host.bucket.take()
+    host.concurrency.acquire()
+    slow = True
+    try:
+        resp = session().get(url, headers=headers)
+        slow = resp.elapsed.total_seconds() > SLOW_RESPONSE or resp.status_code in (429, 503)
+        return resp
+    finally:
+        host.concurrency.release(slow)
+
+
+def _fetch(url):
+    if archive.offline():
+        return archive.get(store_key(url))
+
+    if lawfactory_urls.CACHE_ENABLED:
+        try:
+            with open(cache_file(url), 'rb') as f:
+                resp = pickle.load(f)
+            if '--debug' in sys.argv:
+                print('[download]', url, '[#cached]', file=sys.stderr)
+            return resp
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+
+    cached = read_http_cache(url) if http_cache_enabled() else None
+    headers = {}
+    if cached:
+        if time.time() - cached['fetched'] < freshness(url):
+            return cached['resp']
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    real_url = url
+    legifrance_proxy = None
+    if 'legifrance.gouv.fr' in url:
+        legifrance_proxy = os.getenv('LEGIFRANCE_PROXY')
+        if not legifrance_proxy:
+            raise Exception("You must configure a legifrance-proxy instance to be able to requests Légifrance, see lawfactory_utils README")
+        real_url = legifrance_proxy + url.split('legifrance.gouv.fr')[1]
+
+    if '--debug' in sys.argv:
+        print('[download]', real_url, file=sys.stderr)
+
+    for retry in range(RETRIES, -1, -1):
+        try:
+            resp = _get(real_url, headers)
+            if 500 <= resp.status_code < 600 or resp.status_code == 429:
+                raise HTTPError('%s Server Error for url: %s' % (resp.status_code, real_url), response=resp)
+            break
+        except (ConnectionError, HTTPError):
+            if not retry:
+                raise
+            time.sleep(1 + RETRIES - retry)
+    timings.count_request(len(resp.content))
+
+    if cached and resp.status_code == 304:
+        cached['fetched'] = time.time()
+        write_http_cache(url, cached)
+        return cached['resp']
+
+    if legifrance_proxy:
+        resp.url = resp.url.replace(legifrance_proxy, 'https://www.legifrance.gouv.fr')
+
+    if http_cache_enabled() and resp.status_code == 200:
+        write_http_cache(url, {
+            'resp': resp,
+            'etag': resp.headers.get('ETag'),
+            'last_modified': resp.headers.get('Last-Modified'),
+            'fetched': time.time(),
+        })
+
+    if lawfactory_urls.CACHE_ENABLED:
+        os.makedirs(lawfactory_urls.cache_directory(), exist_ok=True)
+        with open(cache_file(url), 'wb') as f:
+            pickle.dump(resp, f)
+    return resp
+
+
+def fetch(url):
+    """GET an url, the threads asking for an url already being downloaded wait for it"""
+    with _lock:
+        future = _in_flight.get(url)
+        owner = future is None
+        if owner:
+            future = _in_flight[url] = Future()
+    if not owner:
+        return future.result()
+
+    try:
+        resp = _fetch(url)
+        if archive.recording() and not archive.offline():
+            archive.put(store_key(url), resp)
+        future.set_result(resp)
+        return resp
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            del _in_flight[url]
+
+
+def store_key(url):
+    # the cache busting parameter must not prevent to find a prefetched response
+    return re_cache_busting.sub(r'\1', url).rstrip('?&')
+
+
+def response_hash(resp):
+    sha = hashlib.sha1(str(resp.status_code).encode('utf-8'))
+    sha.update(resp.content)
+    return sha.hexdigest()
+
+
+def validators(resp):
+    """the ETag and Last-Modified of a response"""
+    found = {}
+    if resp.headers.get('ETag'):
+        found['etag'] = resp.headers['ETag']
+    if resp.headers.get('Last-Modified'):
+        found['last_modified'] = resp.headers['Last-Modified']
+    return found
+
+
+def download(url):
+    resp = _warm_store.get(store_key(url))
+    if resp is None:
+        resp = fetch(url)
+    _used_responses[store_key(url)] = response_hash(resp)
+    _used_validators[store_key(url)] = validators(resp)
+    return resp
+
+
+def used_responses():
+    """returns {url: hash} for the responses returned by `download()`"""
+    return dict(_used_responses)
+
+
+def used_validators():
+    """returns {url: validators} for the responses returned by `download()` which have some"""
+    return {url: found for url, found in _used_validators.items() if found}
+
+
+def is_modified(url, known):
+    """
+    a conditional request for a page, True or False if the server says the page
+    changed since the response with the `known` validators, None if it can't tell
+    """
+    if not known or archive.offline() or 'legifrance.gouv.fr' in url:
+        return None
+    headers = {}
+    if known.get('etag'):
+        headers['If-None-Match'] = known['etag']
+    if known.get('last_modified'):
+        headers['If-Modified-Since'] = known['last_modified']
+    try:
+        resp = _get(url, headers)
+    except ConnectionError:
+        return None
+    timings.count_request(len(resp.content))
+    if resp.status_code == 304:
+        return False
+    if resp.status_code == 200:
+        # the server ignored the conditions
+        return validators(resp) != known
+    return None
+
+
+def get_prefetched(url):
+    """returns the response if it's in the warm store, without downloading it"""
+    return _warm_store.get(store_key(url))
+
+
+def prefetch(urls):
+    """
+    download the urls concurrently and keep the responses in the warm store,
+    the number of connections to each host is limited by `fetch()`
+
+    failed downloads are ignored, they are retried when `download()` is called
+    """
+    urls = [url for url in dict.fromkeys(urls) if url and store_key(url) not in _warm_store]
+    if not urls:
+        return {}
+
+    def fetch_one(url):
+        try:
+            resp = fetch(url)
+        except Exception:
+            return url, None
+        _warm_store[store_key(url)] = resp
+        return url, resp
+
+    with ThreadPoolExecutor(min(MAX_CONNECTIONS, len(urls))) as executor:
+        return {url: resp for url, resp in executor.map(timings.in_current_stage(fetch_one), urls) if resp is not None}
+
+
+def clear():
+    global _frozen
+    _warm_store.clear()
+    _used_responses.clear()
+    _used_validators.clear()
+    _frozen = None
+
+
+_lawfactory_download = lawfactory_urls.download
+_installed = False
+
+
+def lawfactory_download(url, retry=RETRIES):
+    return download(url)
+
+
+def install():
+    """lawfactory_utils' download is replaced by `download()` in the modules which imported it, and in the next ones"""
+    global _installed
+    _installed = True
+    route_lawfactory_downloads()
+
+
+def route_lawfactory_downloads():
+    """once installed, the modules which imported lawfactory_utils' download use `download()` instead"""
+    if not _installed:
+        return
+    for module in list(sys.modules.values()):
+        try:
+            if getattr(module, 'download', None) is _lawfactory_download:
+                module.download = lawfactory_download
+        except Exception:
+            continue
@@ -0,0 +1,140 @@
+"""
+Fingerprint of the inputs of a parsed dosleg
+
+For each dosleg, we store in <api_directory>/fingerprints/ the hash of every
+downloaded document (dosleg pages, texts, amendments, seances,...) with its
+ETag and Last-Modified, the version of the code and of the parsing libraries
+and the hash of the reference records it used (the groupes, its
+parlementaires and its loi dite). If none of them changed, the parsing would
+produce the same output so it can be skipped.
+
+The pages with an ETag or a Last-Modified are checked with conditional
+requests, only the other ones are downloaded again. With --enable-cache,
+the pages are never downloaded again so nothing is skipped.
+"""
+import glob, hashlib, json, os, sys
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from importlib.metadata import version as package_version
+except ImportError:
+    # python < 3.8
+    import pkg_resources
+    package_version = lambda name: pkg_resources.get_distribution(name).version
+
+try:
+    from . import downloader, reference_data, timings
+    from .common import open_json, print_json
+except ImportError:
+    import downloader, reference_data, timings
+    from common import open_json, print_json
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the libraries whose version changes the output
+PACKAGES = ['senapy', 'anpy', 'lawfactory_utils', 'legipy', 'metslesliens']
+
+_code_version = None
+
+
+def libraries_version(packages=PACKAGES):
+    """the installed versions of the packages, 'senapy==0.3.2 anpy==...'"""
+    versions = []
+    for package in packages:
+        try:
+            version = package_version(package)
+        except Exception:
+            version = None
+        versions.append('%s==%s' % (package, version))
+    return ' '.join(versions)
+
+
+def code_version():
+    """hash of the source code of the parser and of the versions of the libraries"""
+    global _code_version
+    if _code_version is None:
+        sha = hashlib.sha1()
+        for path in sorted(glob.glob(os.path.join(ROOT_DIRECTORY, '*.py')) + glob.glob(os.path.join(ROOT_DIRECTORY, 'tools', '*.py'))):
+            with open(path, 'rb') as f:
+                sha.update(f.read())
+        sha.update(libraries_version().encode('utf-8'))
+        _code_version = sha.hexdigest()
+    return _code_version
+
+
+def record_hash(record):
+    return hashlib.sha1(json.dumps(record, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def reference_records():
+    """hashes of the reference records used by the dosleg just parsed, by name"""
+    return {name: record_hash(record) for name, record in reference_data.used_records().items()}
+
+
+def same_reference_records(records, api_directory):
+    """check the reference records are the same in the reference data of `api_directory` now"""
+    # loaded before checking the first dosleg
+    data = reference_data.get(api_directory)
+    return all(record_hash(reference_data.find_record(data, name)) == digest for name, digest in records.items())
+
+
+def fingerprint_path(api_directory, url_id):
+    return os.path.join(api_directory, 'fingerprints', url_id + '.json')
+
+
+def save(api_directory, url_id, url, dos_id, inputs, validators=None):
+    os.makedirs(os.path.join(api_directory, 'fingerprints'), exist_ok=True)
+    print_json({
+        'url': url,
+        'id': dos_id,
+        'code_version': code_version(),
+        'reference_records': reference_records(),
+        'inputs': inputs,
+        'validators': validators or {},
+    }, fingerprint_path(api_directory, url_id))
+
+
+def load(api_directory, url_id):
+    path = fingerprint_path(api_directory, url_id)
+    if os.path.exists(path):
+        return open_json(path)
+
+
+def _same_inputs(inputs, validators):
+    # first ask the servers, only the pages they can't tell about are downloaded
+    with ThreadPoolExecutor(downloader.MAX_CONNECTIONS) as executor:
+        modified = dict(zip(inputs, executor.map(timings.in_current_stage(
+            lambda url: downloader.is_modified(url, validators.get(url))), inputs)))
+    if any(modified.values()):
+        return False
+    to_download = {url: digest for url, digest in inputs.items() if modified[url] is None}
+    downloader.prefetch(to_download.keys())
+    for url, digest in to_download.items():
+        resp = downloader.get_prefetched(url)
+        if resp is None or downloader.response_hash(resp) != digest:
+            return False
+    return True
+
+
+def is_unchanged(fingerprint, api_directory):
+    """
+    check the inputs of a fingerprint are the same as the ones of `api_directory` now
+
+    the dosleg pages are checked first since they change the most often
+    """
+    if '--enable-cache' in sys.argv or downloader.lawfactory_urls.CACHE_ENABLED:
+        # the cached pages would always be the same
+        return False
+    if not fingerprint or fingerprint.get('code_version') != code_version() \
+            or 'reference_records' not in fingerprint \
+            or not same_reference_records(fingerprint['reference_records'], api_directory):
+        return False
+    inputs = fingerprint['inputs']
+    validators = fingerprint.get('validators', {})
+    dosleg_pages = {url: digest for url, digest in inputs.items() if '/dossier' in url}
+    others = {url: digest for url, digest in inputs.items() if url not in dosleg_pages}
+    unchanged = _same_inputs(dosleg_pages, validators) and _same_inputs(others, validators)
+    if unchanged:
+        # otherwise the dosleg is parsed right after and can use the fresh responses
+        downloader.clear()
+    return unchanged
@@ -0,0 +1,134 @@
+"""
+Work queue of dosleg urls shared by several parse_many workers
+
+The queue is a SQLite database in <api_directory>/queue.sqlite. A worker leases
+a job for a limited time and renews the lease while it works on it, so a job
+whose worker died is given to another worker once its lease expired. A failed
+job is retried later with an exponential backoff until MAX_ATTEMPTS, a job
+whose workers died MAX_ATTEMPTS times is marked as failed.
+
+Workers on several hosts can share the queue if the data directory is on a
+filesystem with working locks (not all NFS setups have them).
+"""
+import os, socket, sqlite3, threading, time
+
+LEASE_DURATION = 600
+MAX_ATTEMPTS = 3
+BACKOFF = 60
+MAX_BACKOFF = 3600
+
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+
+def queue_path(api_directory):
+    return os.path.join(api_directory, 'queue.sqlite')
+
+
+def worker_id():
+    return '%s-%d' % (socket.gethostname(), os.getpid())
+
+
+class JobQueue:
+    def __init__(self, api_directory):
+        os.makedirs(api_directory, exist_ok=True)
+        # autocommit mode, the transactions are explicit
+        self.db = sqlite3.connect(queue_path(api_directory), timeout=60, isolation_level=None,
+            check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            url TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            lease_expires REAL,
+            next_try REAL NOT NULL DEFAULT 0,
+            error TEXT,
+            updated REAL)""")
+
+    def execute(self, query, params=()):
+        with self.lock:
+            return self.db.execute(query, params)
+
+    def enqueue(self, urls):
+        """add the urls to the queue, the finished ones are queued again"""
+        now = time.time()
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            for url in urls:
+                self.db.execute("""INSERT INTO jobs (url, status, updated) VALUES (?, ?, ?)
+                    ON CONFLICT(url) DO UPDATE SET status = ?, attempts = 0, next_try = 0, error = NULL, updated = ?
+                    WHERE status IN (?, ?)""", (url, PENDING, now, PENDING, now, DONE, FAILED))
+            self.db.execute('COMMIT')
+
+    def lease(self, worker, duration=LEASE_DURATION, max_attempts=MAX_ATTEMPTS):
+        """returns (url, attempt) of the next job to do or None"""
+        now = time.time()
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                # the workers of these jobs died (killed, out of memory,...) too many times
+                self.db.execute("""UPDATE jobs SET status = ?, error = ?, updated = ?
+                    WHERE status = ? AND lease_expires < ? AND attempts >= ?""",
+                    (FAILED, 'abandoned lease', now, LEASED, now, max_attempts))
+                row = self.db.execute("""SELECT url, attempts FROM jobs
+                    WHERE (status = ? AND next_try <= ?) OR (status = ? AND lease_expires < ?)
+                    ORDER BY rowid LIMIT 1""", (PENDING, now, LEASED, now)).fetchone()
+                if row:
+                    self.db.execute("""UPDATE jobs SET status = ?, worker = ?, lease_expires = ?,
+                        attempts = attempts + 1, updated = ? WHERE url = ?""",
+                        (LEASED, worker, now + duration, now, row[0]))
+            finally:
+                self.db.execute('COMMIT')
+        if row:
+            return row[0], row[1] + 1
+
+    def heartbeat(self, url, worker, duration=LEASE_DURATION):
+        """extend the lease, returns False if the job was given to another worker"""
+        return self.execute("""UPDATE jobs SET lease_expires = ? WHERE url = ? AND worker = ? AND status = ?""",
+            (time.time() + duration, url, worker, LEASED)).rowcount > 0
+
+    def done(self, url, worker):
+        self.execute("""UPDATE jobs SET status = ?, error = NULL, updated = ? WHERE url = ? AND worker = ?""",
+            (DONE, time.time(), url, worker))
+
+    def fail(self, url, worker, error, max_attempts=MAX_ATTEMPTS):
+        now = time.time()
+        attempts = self.execute('SELECT attempts FROM jobs WHERE url = ?', (url,)).fetchone()[0]
+        if attempts >= max_attempts:
+            self.execute("""UPDATE jobs SET status = ?, error = ?, updated = ? WHERE url = ? AND worker = ?""",
+                (FAILED, error, now, url, worker))
+        else:
+            next_try = now + min(BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+            self.execute("""UPDATE jobs SET status = ?, error = ?, next_try = ?, updated = ? WHERE url = ? AND worker = ?""",
+                (PENDING, error, next_try, now, url, worker))
+
+    def release(self, url, worker):
+        """give back a job without counting it as an attempt"""
+        self.execute("""UPDATE jobs SET status = ?, attempts = attempts - 1, updated = ? WHERE url = ? AND worker = ?""",
+            (PENDING, time.time(), url, worker))
+
+    def counts(self):
+        return dict(self.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def failures(self):
+        return self.execute('SELECT url, error FROM jobs WHERE status = ? ORDER BY rowid', (FAILED,)).fetchall()
+
+    def has_unfinished(self):
+        return self.execute('SELECT 1 FROM jobs WHERE status IN (?, ?) LIMIT 1', (PENDING, LEASED)).fetchone() is not None
+
+
+class Heartbeat(threading.Thread):
+    """renew the lease of a job in the background while it is processed"""
+
+    def __init__(self, queue, url, worker, duration=LEASE_DURATION):
+        super().__init__(daemon=True)
+        self.queue, self.url, self.worker, self.duration = queue, url, worker, duration
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.duration / 3):
+            self.queue.heartbeat(self.url, self.worker, self.duration)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
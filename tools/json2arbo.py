@@ -10,13 +10,14 @@ import os, sys, re
 import urllib.parse
 try:
     from .common import print_json, open_json
+    from . import spill
 except:
     from common import print_json, open_json
+    import spill
 
 
 def mkdirs(d):
-    if not os.path.exists(d):
-        os.makedirs(d)
+    os.makedirs(d, exist_ok=True)
 
 
 def get_step_id(nstep, step):
@@ -38,7 +39,7 @@ def process(dos, OUTPUT_DIR):
         step['directory'] = get_step_id(step_i, step)
         step_dir = os.path.join(OUTPUT_DIR, os.path.join(step['directory'], 'texte'))
 
-        articles = step.get('articles_completed', step.get('articles'))
+        articles = spill.get(step, spill.texts_key(step))
         if not articles:
             continue
 
@@ -66,6 +67,7 @@ def process(dos, OUTPUT_DIR):
         print_json(alldata, os.path.join(step_dir, 'texte.json'))
 
         step['texte.json'] = alldata
+        spill.keep_on_disk(step, 'texte.json', os.path.join(step_dir, 'texte.json'))
 
     return dos
 
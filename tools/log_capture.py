@@ -0,0 +1,75 @@
+"""
+Capture of what a thread prints, to print it again later or in another order
+
+Inside `capture(events)`, what the current thread writes to sys.stdout and
+sys.stderr is appended to `events` instead, the other threads still print
+normally. `replay(events)` prints the events again, in the same order.
+"""
+import contextlib, sys, threading
+
+_local = threading.local()
+_lock = threading.Lock()
+
+
+class ThreadProxy:
+    """replaces sys.stdout or sys.stderr, records the writes of the capturing threads"""
+
+    def __init__(self, name, stream):
+        self.name = name
+        self.stream = stream
+
+    def write(self, message):
+        events = getattr(_local, 'events', None)
+        if events is None:
+            return self.stream.write(message)
+        events.append((self.name, message))
+        return len(message)
+
+    def flush(self):
+        if getattr(_local, 'events', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, attr):
+        return getattr(self.stream, attr)
+
+
+class Recorder:
+    """a file recording what's written to it as `name` events"""
+
+    def __init__(self, events, name):
+        self.events = events
+        self.name = name
+
+    def write(self, message):
+        self.events.append((self.name, message))
+        return len(message)
+
+    def flush(self):
+        pass
+
+
+def install():
+    with _lock:
+        for name in ('stdout', 'stderr'):
+            if not isinstance(getattr(sys, name), ThreadProxy):
+                setattr(sys, name, ThreadProxy(name, getattr(sys, name)))
+
+
+@contextlib.contextmanager
+def capture(events):
+    install()
+    previous = getattr(_local, 'events', None)
+    _local.events = events
+    try:
+        yield events
+    finally:
+        _local.events = previous
+
+
+def replay(events, **files):
+    """print the events again, `files` are the files of the other names of events"""
+    for name, message in events:
+        if name in ('stdout', 'stderr'):
+            getattr(sys, name).write(message)
+        else:
+            files[name].write(message)
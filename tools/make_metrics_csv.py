@@ -7,7 +7,7 @@ from senapy.dosleg import opendata
 from tools.common import upper_first, format_date, datize, strip_text, open_json
 from tools.process_conscons import get_decision_length
 from tools.process_jo import count_signataires, get_texte_length
-from tools import parse_texte
+from tools import parse_texte, parse_cache
 from parse_one import *
 
 
@@ -139,7 +139,7 @@ def add_metrics_via_adhoc_parsing(dos, verbose=True):
         try:
             articles = parse_texte.parse(last_text['source_url'])
             if articles and articles[0].get('definitif'):
-                dos['Taille finale'] = read_text(parse_texte.parse(last_text['source_url']))
+                dos['Taille finale'] = read_text(articles)
             else:
                 dos['Taille finale'] = get_texte_length(parsed_dos['url_jo']) if 'url_jo' in parsed_dos else ''
         except:
@@ -251,6 +251,9 @@ if __name__ == '__main__':
     verbose = "--quiet" not in sys.argv
     if not verbose:
         sys.argv.remove("--quiet")
+    if "--enable-parse-cache" in sys.argv:
+        sys.argv.remove("--enable-parse-cache")
+        parse_cache.enable_parse_cache()
     run_old = len(sys.argv) > 2
     enable_requests_cache()
     senat_csv = parse_senat_open_data(run_old=run_old)
@@ -0,0 +1,88 @@
+"""
+Client of the NosDéputés/NosSénateurs API for the amendments and the seances
+
+The seances of a text and the two forms of a TA url (TA0XXX or TAXXX) are
+downloaded concurrently, unless --no-prefetch or --low-memory is given. The
+form of a TA url without amendments is remembered in url_resolutions so it's
+not downloaded again, the amendments found in both forms are only kept once
+and only the fields used by prepare_amendements are kept.
+"""
+import sys
+
+try:
+    from .downloader import download, prefetch
+    from . import spill, url_resolutions
+except ImportError:
+    from downloader import download, prefetch
+    import spill, url_resolutions
+
+# the fields of an amendment used by prepare_amendements
+AMENDEMENT_FIELDS = ('id', 'numero', 'date', 'sort', 'sujet', 'source', 'signataires',
+    'groupes_parlementaires', 'parlementaires', 'cle_unicite', 'url_nosdeputes', 'url_nossenateurs')
+
+
+def concurrent():
+    return '--no-prefetch' not in sys.argv and not spill.enabled()
+
+
+def download_all(urls):
+    """the responses of the urls, in the same order"""
+    if concurrent() and len(urls) > 1:
+        prefetch(urls)
+    return [download(url) for url in urls]
+
+
+def seances_url(urlapi, loiid, step):
+    commission_or_hemicycle = '?commission=1' if step.get('step') == 'commission' else '?hemicycle=1'
+    return 'https://{}.fr/seances/{}/json{}'.format(urlapi, loiid, commission_or_hemicycle)
+
+
+def seance_url(urlapi, seance_id, loiid):
+    return 'https://{}.fr/seance/{}/{}/json'.format(urlapi, seance_id, loiid)
+
+
+def is_known_empty(amdt_url, other_url):
+    """True if the url had no amendments last time while `other_url` (the other form of a TA url) had some"""
+    if not other_url:
+        return False
+    known = url_resolutions.lookup(url_resolutions.AMENDEMENTS, amdt_url)
+    other = url_resolutions.lookup(url_resolutions.AMENDEMENTS, other_url)
+    return bool(known and not known['resolved_url'] and other and other['resolved_url'])
+
+
+def amendements_urls(amdt_url, alternative_url):
+    """the forms of the url of the amendments of a text which may have some"""
+    return [url for url, other_url in ((amdt_url, alternative_url), (alternative_url, amdt_url))
+        if url and not is_known_empty(url, other_url)]
+
+
+def project(amendement):
+    return {'amendement': {field: value for field, value in amendement['amendement'].items()
+        if field in AMENDEMENT_FIELDS}}
+
+
+def amendements(amdt_urls):
+    """
+    returns {url: amendments} for the urls of the amendments of a text,
+    the amendments already returned for a previous url are left out
+    """
+    responses = download_all(amdt_urls)
+    result = {}
+    seen = set()
+    for amdt_url, resp in zip(amdt_urls, responses):
+        found = resp.json().get('amendements', [])
+        url_resolutions.remember(url_resolutions.AMENDEMENTS, amdt_url, amdt_url if found else None, resp.status_code)
+        result[amdt_url] = []
+        for amd in found:
+            if amd['amendement']['id'] in seen:
+                continue
+            seen.add(amd['amendement']['id'])
+            result[amdt_url].append(project(amd))
+    return result
+
+
+def seances(urlapi, loiid, step):
+    """returns the ids of the seances of a text and their responses, sorted by id"""
+    resp = download(seances_url(urlapi, loiid, step))
+    ids = sorted(obj['seance'] for obj in resp.json().get('seances', []))
+    return list(zip(ids, download_all([seance_url(urlapi, seance_id, loiid) for seance_id in ids])))
@@ -0,0 +1,193 @@
+"""
+On-disk cache of the articles returned by parse_texte.parse
+
+An entry is keyed by the url, the hash of the downloaded text and the version
+of the parser (its code and the installed versions of the html parsing
+libraries), so a text is only parsed again when it or the parser changed.
+It is enabled with --enable-parse-cache and stored in cache/parse_texte/
+(or in $LAWFACTORY_PARSE_CACHE).
+
+The texts of a report with many texts are also kept under the hash of the
+report and their number, whatever the url they were found at.
+
+The least recently used entries are removed when the cache grows over
+$LAWFACTORY_PARSE_CACHE_SIZE megabytes (default: 500).
+
+Usage: python tools/parse_cache.py stats|list|prune|purge [url]
+"""
+import glob, gzip, hashlib, json, os, sys, threading, time
+
+try:
+    from . import fingerprints
+except ImportError:
+    import fingerprints
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the modules whose code changes the output of the parsing
+PARSER_FILES = ('parse_texte.py', 'sort_articles.py', 'common.py', 'regex_profile.py')
+
+# the libraries building the trees read by parse_texte
+HTML_PARSER_PACKAGES = ['beautifulsoup4', 'html5lib', 'lxml']
+
+# how many entries are written between two checks of the size of the cache
+PRUNE_EVERY = 100
+
+CACHE_ENABLED = False
+_parser_version = None
+_written = 0
+
+
+def enable_parse_cache():
+    global CACHE_ENABLED
+    CACHE_ENABLED = True
+
+
+def enabled():
+    return CACHE_ENABLED or '--enable-parse-cache' in sys.argv
+
+
+def cache_directory():
+    return os.getenv('LAWFACTORY_PARSE_CACHE') or os.path.join(ROOT_DIRECTORY, 'cache', 'parse_texte')
+
+
+def max_size():
+    return int(os.getenv('LAWFACTORY_PARSE_CACHE_SIZE', 500)) * 1024 * 1024
+
+
+def parser_version():
+    global _parser_version
+    if _parser_version is None:
+        sha = hashlib.sha1()
+        for filename in PARSER_FILES:
+            with open(os.path.join(ROOT_DIRECTORY, 'tools', filename), 'rb') as f:
+                sha.update(f.read())
+        sha.update(fingerprints.libraries_version(HTML_PARSER_PACKAGES).encode('utf-8'))
+        _parser_version = sha.hexdigest()
+    return _parser_version
+
+
+def key(url, text, html_parser='html5lib'):
+    sha = hashlib.sha1(parser_version().encode('utf-8'))
+    sha.update(url.encode('utf-8'))
+    if html_parser != 'html5lib':
+        sha.update(b'\0' + html_parser.encode('utf-8'))
+    sha.update(b'\0')
+    sha.update(hashlib.sha1(text.encode('utf-8')).digest())
+    return sha.hexdigest()
+
+
+def entry_path(key):
+    return os.path.join(cache_directory(), key[:2], key + '.json.gz')
+
+
+def all_entries():
+    return glob.glob(os.path.join(cache_directory(), '*', '*.json.gz'))
+
+
+def read_entry(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def get(key):
+    """returns the cached articles or None, a new copy is returned each time"""
+    path = entry_path(key)
+    try:
+        articles = read_entry(path)['articles']
+    except (OSError, ValueError, KeyError):
+        return None
+    # the modification time is the last use for the LRU eviction
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return articles
+
+
+def put(key, url, articles):
+    global _written
+    path = entry_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpfile = "%s.%d-%d.tmp" % (path, os.getpid(), threading.get_ident())
+    with gzip.open(tmpfile, 'wt', encoding='utf-8') as f:
+        json.dump({
+            'url': url,
+            'parser_version': parser_version(),
+            'created': time.time(),
+            'articles': articles,
+        }, f, ensure_ascii=False)
+    os.replace(tmpfile, path)
+
+    _written += 1
+    if _written % PRUNE_EVERY == 0:
+        prune()
+
+
+def prune(size=None):
+    """remove the least recently used entries until the cache is smaller than `size`"""
+    size = max_size() if size is None else size
+    entries = []
+    for path in all_entries():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(entry_size for _, entry_size, _ in entries)
+    removed = 0
+    for _, entry_size, path in sorted(entries):
+        if total <= size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= entry_size
+        removed += 1
+    return removed
+
+
+def purge(url=None):
+    """remove all the entries, or only the ones of an url"""
+    removed = 0
+    for path in all_entries():
+        try:
+            if url is None or read_entry(path).get('url') == url:
+                os.remove(path)
+                removed += 1
+        except (OSError, ValueError):
+            continue
+    return removed
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    if command == 'stats':
+        entries = all_entries()
+        current = 0
+        for path in entries:
+            try:
+                current += read_entry(path).get('parser_version') == parser_version()
+            except (OSError, ValueError):
+                continue
+        print('directory:', cache_directory())
+        print('entries:', len(entries))
+        print('  for the current parser version:', current)
+        print('size: %.1f MB (max: %.1f MB)' % (
+            sum(os.path.getsize(path) for path in entries) / 1024 / 1024, max_size() / 1024 / 1024))
+    elif command == 'list':
+        for path in sorted(all_entries(), key=os.path.getmtime):
+            entry = read_entry(path)
+            print(time.strftime('%Y-%m-%d %H:%M', time.localtime(os.path.getmtime(path))),
+                '%6d' % os.path.getsize(path),
+                '%3d articles' % len(entry['articles']),
+                '' if entry.get('parser_version') == parser_version() else '(outdated)',
+                entry['url'])
+    elif command == 'prune':
+        print('removed', prune(), 'entries')
+    elif command == 'purge':
+        print('removed', purge(sys.argv[2] if len(sys.argv) > 2 else None), 'entries')
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -5,20 +5,29 @@
 Run with python parse_texte.py <URL>
 Outputs results to stdout
 
-Dependencies :
-html5lib, beautifulsoup4"""
+From python, parse() returns the list of the records of a text and
+iter_parse() yields them while the text is read
+
+python parse_texte.py <URL>... --profile-regexps prints the time spent in
+each regexp instead
 
-import sys, re, copy
-from bs4 import BeautifulSoup
+Dependencies :
+html5lib, beautifulsoup4 (lxml for --html-parser lxml)"""
 
-from lawfactory_utils.urls import download
+import sys, re, copy, hashlib, threading
+from collections import OrderedDict
+from bs4 import BeautifulSoup, FeatureNotFound
 
 try:
     from .sort_articles import bister
     from .common import get_text_id, upcase_accents, real_lower, print_json
+    from .downloader import download
+    from . import parse_cache
 except (SystemError, ImportError):
     from sort_articles import bister
     from common import get_text_id, upcase_accents, real_lower, print_json
+    from downloader import download
+    import parse_cache
 
 
 # inspired by duralex/alinea_parser.py
@@ -51,17 +60,47 @@ def word_to_number(word):
         return str(words[word])
 
 
+# the parsers BeautifulSoup can use, html5lib is the reference one,
+# check the others with tests/compare_html_parsers.py before using them
+HTML_PARSERS = ('html5lib', 'lxml', 'html.parser')
+DEFAULT_HTML_PARSER = 'html5lib'
+
+_available_parsers = set()
+
+
+def get_html_parser():
+    if '--html-parser' in sys.argv:
+        return sys.argv[sys.argv.index('--html-parser') + 1]
+    return DEFAULT_HTML_PARSER
+
+
+def check_html_parser(html_parser):
+    """raises a ValueError if BeautifulSoup can't use the parser"""
+    if html_parser in _available_parsers:
+        return
+    if html_parser not in HTML_PARSERS:
+        raise ValueError('unknown html parser %s, use one of: %s' % (html_parser, ', '.join(HTML_PARSERS)))
+    try:
+        BeautifulSoup('', html_parser)
+    except FeatureNotFound:
+        raise ValueError('the html parser %s is not installed (pip install %s)' % (html_parser, html_parser))
+    _available_parsers.add(html_parser)
+
+
 def non_recursive_find_all(node, test):
     """
     if there's a <p> inside a <p>, we don't want to process both
     so we stop at the first top-level <p> we find
     and ignore the children
     """
-    if test(node):
-        yield node
-    elif hasattr(node, 'children'):
-        for child in node.children:
-            yield from non_recursive_find_all(child, test)
+    # walked with a stack, in document order
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if test(node):
+            yield node
+        elif hasattr(node, 'contents'):
+            stack.extend(reversed(node.contents))
 
 
 def clean_extra_expose_des_motifs(html):
@@ -70,6 +109,9 @@ def clean_extra_expose_des_motifs(html):
     at the depot step, we remove all of them except the last one
     to make the later parsing easier
     """
+    # the exposés are counted once per line below, most texts don't have enough
+    if html.count('>Exposé des motifs') <= 3:
+        return html, False
     before_expose, after_expose = [], []
     last_expose = []
     expose = False
@@ -174,23 +216,31 @@ re_clean_spaces = re.compile(r'\s+')
 re_clean_coord = re.compile(r'^(<i>)?([\["\(\s]+|pour)*coordination[\]\)\s\.]*(</i>)?', re.I)
 # Clean html and special chars
 lower_inner_title = lambda x: x.group(1)+lower_but_first(x.group(3))+" "
-html_replace = [
-    (re.compile(r"−"), "-"),
-    (re.compile(r" "), " "),
+# the single characters are replaced in one pass, with a table
+html_chars_first = {'−': '-', '\xa0': ' '}
+html_chars = {}
+html_chars.update(dict.fromkeys('«»“”„‟❝❞＂〟〞〝', '"'))
+html_chars.update(dict.fromkeys('’＇ߴ՚ʼ❛❜', "'"))
+html_chars.update(dict.fromkeys('‒–—―⁓‑‐⁃⏤', '-'))
+re_html_chars_first = re.compile('[%s]' % ''.join(html_chars_first))
+re_html_chars = re.compile('[%s]' % ''.join(html_chars))
+# (regexp, replacement) or (regexp, replacement, string needed by the regexp to match)
+# applied before html_chars
+html_replace_first = [
     (re.compile(r"<!--.*?-->", re.I), ""),
     (re.compile(r"<span[^>]*color: #(0070b9|006fb9)[^>]*>\(\d+\)\s*</span>", re.I), ""), # remove pastilles
     (re.compile(r"<span[^>]*color: white[^>]*>.*?</span>", re.I), ""), # remove invisible text
     (re.compile(r"(<img[^>]*>\s*<br/>\s*)", re.I), ""), # remove <img><br/> before the next regex kills my precious '«'
     (re.compile(r"</?br/?>\s+", re.I), " "),
     (re.compile(r'(«\s+|\s+»)'), '"'),
-    (re.compile(r'(«|»|“|”|„|‟|❝|❞|＂|〟|〞|〝)'), '"'),
-    (re.compile(r"(’|＇|’|ߴ|՚|ʼ|❛|❜)"), "'"),
-    (re.compile(r"(‒|–|—|―|⁓|‑|‐|⁃|⏤)"), "-"),
+]
+# applied after html_chars
+html_replace = [
     (re.compile(r"(</?\w+)[^>]*>"), r"\1>"), # removes html attributes
     (re.compile(r"(</?)em>", re.I), r"\1i>"),
     (re.compile(r"(</?)strong>", re.I), r"\1b>"),
     (re.compile(r"<(![^>]*|/?(p|span))>", re.I), ""),
-    (re.compile(r"\s*\n+\s*"), " "),
+    (re.compile(r"\s*\n+\s*"), " ", "\n"),
     (re.compile(r"<[^/>]*></[^>]*>"), ""),
     (re.compile(r"^<b><i>", re.I), "<i><b>"),
     (re.compile(r"</b>(\s*)<b>", re.I), r"\1"),
@@ -201,26 +251,35 @@ html_replace = [
     (re.compile(r"^(<b>Article\s*)\d+\s*(?:<s>\s*)+", re.I), r"\1"),
     (re.compile(r"</?s>", re.I), ""),
     (re.compile(r"\s*</?img>\s*", re.I), ""),
-    (re.compile(r"œ([A-Z])"), r"OE\1"),
+    (re.compile(r"œ([A-Z])"), r"OE\1", "œ"),
     (re.compile(r"œ\s*", re.I), "oe"),
     (re.compile(r'^((<[^>]*>)*")%s ' % section_titles, re.I), lower_inner_title),
     (re.compile(r' pr..?liminaire', re.I), ' préliminaire'),
     (re.compile(r'<strike>[^<]*</strike>', re.I), ''),
     (re.compile(r'^<a>(\w)', re.I), r"\1"),
     (re.compile(r'^[.…]{5,}\s*(((suppr|conforme).{0,10}?)+)\s*[.…]{5,}\s*$', re.I), r"\1"),  # clean "......Conforme....." to "Conforme"
-    (re.compile(r'(\w\s*(?:\</[^>]*>)*\s*)\.{10,}(\s*;)?(</i>)?$', re.I), r"\1\2\3"),  # clean "III. - <i>Conform[e</i>.......]" to "III. - <i>Conform[e</i>]"
+    (re.compile(r'(\w\s*(?:\</[^>]*>)*\s*)\.{10,}(\s*;)?(</i>)?$', re.I), r"\1\2\3", '.' * 10),  # clean "III. - <i>Conform[e</i>.......]" to "III. - <i>Conform[e</i>]"
     (re_clean_spaces, " ")
 ]
 
 
-def clean_html(t):
-    for i, (regex, repl) in enumerate(html_replace):
+def apply_regexps(t, regexps):
+    for regex, repl, *needed in regexps:
+        if needed and needed[0] not in t:
+            continue
         try:
             t = regex.sub(repl, t)
         except Exception as e:
             print("Crashed while applying regexp", regex, "with replacement", repl, "to", t)
             raise e
-    return t.strip()
+    return t
+
+
+def clean_html(t):
+    t = re_html_chars_first.sub(lambda m: html_chars_first[m.group(0)], t)
+    t = apply_regexps(t, html_replace_first)
+    t = re_html_chars.sub(lambda m: html_chars[m.group(0)], t)
+    return apply_regexps(t, html_replace).strip()
 
 re_clean_et = re.compile(r'(,|\s+et)\s+', re.I)
 
@@ -232,7 +291,13 @@ re_move_table_guillemets_left = re.compile(r'^(<table[^>]*>(?:<thead[^>]*>.*?</t
 re_move_table_guillemets_right = re.compile(r'<td[^>]*>\s*("\.?)\s*</td>(</tr>(?:</tbody>)?</table>)$', re.I)
 re_move_table_guillemets_within = re.compile(r'^(<table[^>]*>(?:<thead[^>]*>.*?</thead>)?(?:<tbody[^>]*>)?<tr[^>]*><td[^>]*>)\s*"\s*([^"]+)\s*("\.?)\s*(</td></tr>(?:</tbody>)?</table>)$', re.I)
 
-def add_to_articles(dic, all_articles):
+def article_records(dic):
+    """
+    yields the records of a parsed item, the articles are cleaned and the
+    multiple articles ("Articles 3 et 4") are split
+
+    `dic` is yielded as is, the caller must not change it afterwards
+    """
     # Clean empty articles with only "Supprimé" as text
     if not dic:
         return
@@ -255,9 +320,7 @@ def add_to_articles(dic, all_articles):
         multiples = re_clean_et.sub(',', dic['titre']).split(',')
         if len(multiples) > 1:
             for d in multiples:
-                new = copy.deepcopy(dic)
-                new['titre'] = d
-                all_articles.append(new)
+                yield dict(dic, titre=d, alineas=dict(dic['alineas']))
             return
         # Cleanup guillemets around tables
         if '<table' in "".join(dic["alineas"].values()):
@@ -288,7 +351,11 @@ def add_to_articles(dic, all_articles):
                 als['%03d' % i] = al
                 i += 1
             dic['alineas'] = als
-    all_articles.append(copy.deepcopy(dic))
+    yield dic
+
+
+def add_to_articles(dic, all_articles):
+    all_articles.extend(article_records(copy.deepcopy(dic)))
 
 
 blank_none = lambda x: x if x else ""
@@ -330,6 +397,8 @@ re_echec_com4 = re.compile(r"l(a|es) motions?( | .{0,5} )tendant à opposer la q
 re_echec_com5 = re.compile(r"(la|votre) commission a décidé de ne pas adopter [dleau\s]*(projet|proposition|texte)", re.I)
 re_echec_com6 = re.compile(r"[dleau\s]*(projet|proposition|texte) est (considéré comme )?rejetée? par la commission", re.I)
 re_echec_cmp = re.compile(r" (a conclu à l'échec de ses travaux|(ne|pas) .*parven(u[es]?|ir) à (élaborer )?un texte commun)", re.I)
+# each re_echec_* needs one of these words, the other lines are not tested further
+echec_words = ('rejet', 'adopt', 'parven', 'échec', 'élabor', 'établir', 'préalable', 'poursuivre')
 re_rap_mult = re.compile(r'[\s<>/ai]*N[°\s]*\d+\s*(,|et)\s*[N°\s]*\d+', re.I)
 re_src_mult = re.compile(r'^- L(?:A PROPOSITION|E PROJET) DE LOI n°\s*(\d+)\D')
 re_clean_mult_1 = re.compile(r'\s*et\s*', re.I)
@@ -340,6 +409,22 @@ re_stars = re.compile(r'^[\s*_]+$')
 re_art_uni = re.compile(r'\s*article\s*unique\s*$', re.I)
 
 
+def is_echec(cl_line):
+    lower_line = cl_line.lower()
+    if not any(word in lower_line for word in echec_words):
+        return False
+    return bool(re_echec_cmp.search(cl_line)
+        or re_echec_com.search(cl_line)
+        or re_echec_com2.search(cl_line)
+        or re_echec_com3.search(cl_line)
+        or re_echec_com4.search(cl_line)
+        or re_echec_com5.search(cl_line)
+        or re_echec_com6.search(cl_line)
+        or re_echec_hemi.match(cl_line)
+        or re_echec_hemi2.search(cl_line)
+        or re_echec_hemi3.search(cl_line))
+
+
 def normalize_1(name, one):
     name = name.strip()
     name = re_cl_uno.sub(one, name)
@@ -348,7 +433,7 @@ def normalize_1(name, one):
     return name.strip().strip(" -'")
 
 
-def normalize_section_title(line, line_soup, has_multiple_expose):
+def normalize_section_title(line, line_html, has_multiple_expose):
     # transforms "Xeme partie (: <titre>)" to "partie Xeme (: <titre>)"
     m = re_cl_sec_part.match(line)
     if m:
@@ -365,7 +450,7 @@ def normalize_section_title(line, line_soup, has_multiple_expose):
         #       since there are bugs in the AN HTML
         #       ex: alinea III. in article 11 having <a name="XXX">:
         #       http://www.assemblee-nationale.fr/14/ta/ta0208.asp
-        if m.group('tag') or ('<a name=' in str(line_soup) and has_multiple_expose):
+        if m.group('tag') or ('<a name=' in line_html and has_multiple_expose):
             # treats A, B, C as sub-sections and I, II, III as sections
             type = 'sous-section' \
                 if m.group('tag') == 'b' or re.match(r'[A-H]', m.group('num')) \
@@ -374,12 +459,11 @@ def normalize_section_title(line, line_soup, has_multiple_expose):
     return line
 
 
-def clean_article_name(text):
+def clean_article_name(html):
     # Only keep first line for article name
     # but to do that while keeping the regexes the same
     # we need to add our own marker
     NEW_LINE_MARKER = 'NEW_LINE_MARKER'
-    html = str(text)
     html = re.sub(r'<br/?>', NEW_LINE_MARKER, html)
     line = clean_html(html)
     cl_line = re_cl_html.sub("", line).strip()
@@ -393,27 +477,201 @@ def clean_article_name(text):
 
     return cl_line
 
-def parse(url, resp=None):
+def parse(url, resp=None, html_parser=None):
     """
     parse the text of an url, an already cached  to`resp` can be passed to avoid an extra network request
+
+    `html_parser` is one of HTML_PARSERS (default: --html-parser or html5lib)
     """
-    all_articles = []
-    def pr_js(article):
-        nonlocal all_articles
-        add_to_articles(article, all_articles)
+    return list(iter_parse(url, resp=resp, html_parser=html_parser))
+
+
+def url_ids(url):
+    """the ids of the texte of an url and its number"""
+    ids = {}
+    numero = None
+    # Generate Senat or AN ID from URL
+    if url.startswith('http'):
+        if "legifrance.gouv.fr" in url:
+            m = re.search(r"cidTexte=(JORFTEXT\d+)(\D|$)", url, re.I)
+            ids["id"] = m.group(1)
+        elif re.search(r"assemblee-?nationale", url, re.I):
+            m = re.search(r"/(\d+)/.+/(ta)?[\w\-]*(\d{4})[\.\-]", url, re.I)
+            numero = int(m.group(3))
+            ids["id"] = "A" + m.group(1) + "-"
+            if m.group(2) is not None:
+                ids["id"] += m.group(2)
+            ids["id"] += str(numero)
+            ids["nosdeputes_id"] = get_text_id(url)
+        else:
+            m = re.search(r"(ta|l)?s?(\d\d)-(\d{1,3})(rec)?\d?(_mono)?\.", url, re.I)
+            if m is None:
+                m = re.search(r"/(-)?20(\d+)-\d+/(\d+)(_mono)?.html", url, re.I)
+            numero = int(m.group(3))
+            ids["id"] = "S" + m.group(2) + "-"
+            if m.group(1) is not None:
+                ids["id"] += m.group(1)
+            ids["id"] += "%03d" % numero
+            ids["nossenateurs_id"] = get_text_id(url)
+    return ids, numero
+
+
+def new_texte(url, definitif, ids):
+    texte = {"type": "texte", "source": url, "definitif": definitif}
+    texte.update(ids)
+    return texte
+
+
+def should_be_parsed(x):
+    """returns True if x can contain useful information"""
+    if x.name not in ('p', 'table', 'h2', 'h4'):
+        return False
+    # hack: we don't want to parse the table containing the conclusion from the senat
+    # ex: https://www.senat.fr/leg/tas12-040.html
+    if x.name == "table" and re.search("SESSION (EXTRA)?ORDINAIRE DE", str(x)):
+        return False
+    return True
+
+
+def read_blocks(soup):
+    """yields the (html, cleaned html) of the paragraphs and tables of the soup to parse"""
+    for text in non_recursive_find_all(soup, should_be_parsed):
+        # serialized only once for all the checks below
+        html = str(text)
+        # the subtree is not needed anymore, free it
+        text.clear()
+        line = clean_html(html)
+
+        # limit h2/h4 matches to PPL headers or Article unique
+        if text.name not in ('p', 'table') and not re_mat_ppl.match(line) and 'Article unique' not in line:
+            continue
+
+        if re_stars.match(line):
+            continue
+        yield html, line
 
-    def save_text(txt):
-        if "done" not in txt:
-            pr_js(txt)
-        txt["done"] = True
-        return txt
+
+class Blocks:
+    """
+    the blocks of a soup, read when they are first needed, with `keep` they
+    are also kept to read the other texts of a report
+    """
+
+    def __init__(self, soup, keep=False):
+        self.reader = read_blocks(soup)
+        self.read = [] if keep else None
+        self.numbers = []
+
+    def __iter__(self):
+        for block in self.reader:
+            if re_rap_mult.match(block[1]):
+                line = re_clean_mult_2.sub("", re_clean_mult_1.sub(",", re_cl_html.sub("", block[1]).strip()))
+                self.numbers += [int(n_t) for n_t in line.split(',') if n_t.isdigit()]
+            if self.read is not None:
+                self.read.append(block)
+            yield block
+
+    def report_numbers(self):
+        """the numbers of the texts listed in the blocks read, a report with many texts lists them"""
+        return self.numbers
+
+
+# the texts of the reports with many texts: {(body hash, html parser, numero): records}
+REPORTS_CACHE_SIZE = 64
+_report_texts = OrderedDict()
+_report_texts_lock = threading.Lock()
+
+# the blocks of the reports with many texts, their texts are read when
+# they are first asked for: {(body hash, html parser): report}
+REPORTS_BLOCKS_CACHE_SIZE = 8
+_report_blocks = OrderedDict()
+
+
+def report_key(string, html_parser, numero):
+    return (hashlib.sha1(string.encode('utf-8')).hexdigest(), html_parser, numero)
+
+
+def report_disk_key(key):
+    # the same text can be found at many urls, the url of the key is a fake one
+    body, html_parser, numero = key
+    return parse_cache.key('report:%s#%d' % (body, numero), '', html_parser)
+
+
+def get_report_text(key):
+    with _report_texts_lock:
+        records = _report_texts.get(key)
+        if records is not None:
+            _report_texts.move_to_end(key)
+        report = _report_blocks.get(key[:2])
+    if records is not None:
+        return copy.deepcopy(records)
+    if parse_cache.enabled():
+        records = parse_cache.get(report_disk_key(key))
+        if records is not None:
+            return records
+    if report is not None and key[2] in report['numbers']:
+        records = list(read_texte(report['blocks'], dict(report['texte']), key[2], report['has_multiple_expose']))
+        put_report_text(key, report['url'], records)
+        return copy.deepcopy(records)
+
+
+def put_report_blocks(key, url, blocks, numbers, texte, has_multiple_expose):
+    # the other texts can be after the end of the one read
+    for _ in blocks:
+        pass
+    report = {
+        'url': url,
+        'blocks': blocks.read,
+        'numbers': set(numbers),
+        'texte': texte,
+        'has_multiple_expose': has_multiple_expose,
+    }
+    with _report_texts_lock:
+        _report_blocks[key] = report
+        while len(_report_blocks) > REPORTS_BLOCKS_CACHE_SIZE:
+            _report_blocks.popitem(last=False)
+
+
+def put_report_text(key, url, records):
+    with _report_texts_lock:
+        _report_texts[key] = records
+        while len(_report_texts) > REPORTS_CACHE_SIZE:
+            _report_texts.popitem(last=False)
+    if parse_cache.enabled():
+        parse_cache.put(report_disk_key(key), url, records)
+
+
+def with_url(records, url, ids):
+    """the records of a text of a report found at another url"""
+    if records and records[0].get('type') == 'texte':
+        texte = new_texte(url, records[0]['definitif'], ids)
+        for key, value in records[0].items():
+            if key not in texte and key not in ('id', 'nosdeputes_id', 'nossenateurs_id'):
+                texte[key] = value
+        records[0] = texte
+    return records
+
+
+def iter_parse(url, resp=None, html_parser=None):
+    """
+    like `parse()` but yields the texte, section and article records as soon
+    as they are read
+
+    the texte record is the first one, its 'definitif' can still be set to
+    True until the end of the parsing
+
+    when the url is a report with many texts, its blocks are kept so the other
+    texts of the report are read from them without parsing the page again
+    """
+    html_parser = html_parser or get_html_parser()
+    check_html_parser(html_parser)
 
     if url.endswith('.pdf'):
         print("WARNING: text url is a pdf: %s skipping it..." % url)
-        return all_articles
+        return
     if 'assemblee-nat.fr' in url:
         print("WARNING: url corresponds to old AN website: %s skipping it..." % url)
-        return all_articles
+        return
 
 
     if url.startswith('http'):
@@ -424,6 +682,28 @@ def parse(url, resp=None):
     else:
         string = open(url).read()
 
+    cache_key = None
+    if parse_cache.enabled():
+        cache_key = parse_cache.key(url, string, html_parser)
+        cached_articles = parse_cache.get(cache_key)
+        if cached_articles is not None:
+            yield from cached_articles
+            return
+
+    ids, numero = url_ids(url)
+
+    # the légifrance texts are never reports
+    key = None
+    if numero is not None and 'legifrance.gouv.fr' not in url:
+        key = report_key(string, html_parser, numero)
+        records = get_report_text(key)
+        if records is not None:
+            records = with_url(records, url, ids)
+            if cache_key:
+                parse_cache.put(cache_key, url, records)
+            yield from records
+            return
+
     string, has_multiple_expose = clean_extra_expose_des_motifs(string)
 
     if 'legifrance.gouv.fr' in url:
@@ -435,35 +715,47 @@ def parse(url, resp=None):
 
 
     definitif = re_definitif.search(string) is not None or 'legifrance.gouv.fr' in url
-    soup = BeautifulSoup(string, "html5lib")
-    texte = {"type": "texte", "source": url, "definitif": definitif}
-
-    # Generate Senat or AN ID from URL
-    if url.startswith('http'):
-        if "legifrance.gouv.fr" in url:
-            m = re.search(r"cidTexte=(JORFTEXT\d+)(\D|$)", url, re.I)
-            texte["id"] = m.group(1)
-        elif re.search(r"assemblee-?nationale", url, re.I):
-            m = re.search(r"/(\d+)/.+/(ta)?[\w\-]*(\d{4})[\.\-]", url, re.I)
-            numero = int(m.group(3))
-            texte["id"] = "A" + m.group(1) + "-"
-            if m.group(2) is not None:
-                texte["id"] += m.group(2)
-            texte["id"] += str(numero)
-            texte["nosdeputes_id"] = get_text_id(url)
-        else:
-            m = re.search(r"(ta|l)?s?(\d\d)-(\d{1,3})(rec)?\d?(_mono)?\.", url, re.I)
-            if m is None:
-                m = re.search(r"/(-)?20(\d+)-\d+/(\d+)(_mono)?.html", url, re.I)
-            numero = int(m.group(3))
-            texte["id"] = "S" + m.group(2) + "-"
-            if m.group(1) is not None:
-                texte["id"] += m.group(1)
-            texte["id"] += "%03d" % numero
-            texte["nossenateurs_id"] = get_text_id(url)
-
+    soup = BeautifulSoup(string, html_parser)
+    del string
+    texte = new_texte(url, definitif, ids)
     texte["titre"] = re_clean_title_legif.sub('', soup.title.string.strip()) if soup.title else ""
     texte["expose"] = ""
+
+    blocks = Blocks(soup, keep=key is not None)
+    all_articles = [] if cache_key else None
+    for record in read_texte(blocks, dict(texte), numero, has_multiple_expose):
+        if all_articles is not None:
+            all_articles.append(record)
+        yield record
+
+    if cache_key:
+        parse_cache.put(cache_key, url, all_articles)
+
+    report_numbers = blocks.report_numbers() if key is not None else []
+    if report_numbers:
+        put_report_blocks(key[:2], url, blocks, report_numbers + [numero], texte, has_multiple_expose)
+
+
+def read_texte(blocks, texte, numero, has_multiple_expose):
+    """
+    yields the records of the text `numero` found in the blocks, a report can
+    contain many texts
+    """
+    first_record = None
+
+    def pr_js(article):
+        nonlocal first_record
+        for record in article_records(article):
+            if first_record is None:
+                first_record = record
+            yield record
+
+    def save_text(txt):
+        if "done" not in txt:
+            # the texte is changed after it's saved
+            yield from pr_js(dict(txt))
+        txt["done"] = True
+
     expose = False
 
     # 'read' can be
@@ -479,25 +771,7 @@ def parse(url, resp=None):
     srclst = []
     section = {"type": "section", "id": ""}
 
-    def should_be_parsed(x):
-        """returns True if x can contain useful information"""
-        if x.name not in ('p', 'table', 'h2', 'h4'):
-            return False
-        # hack: we don't want to parse the table containing the conclusion from the senat
-        # ex: https://www.senat.fr/leg/tas12-040.html
-        if x.name == "table" and re.search("SESSION (EXTRA)?ORDINAIRE DE", str(x)):
-            return False
-        return True
-
-    for text in non_recursive_find_all(soup, should_be_parsed):
-        line = clean_html(str(text))
-
-        # limit h2/h4 matches to PPL headers or Article unique
-        if text.name not in ('p', 'table') and not re_mat_ppl.match(line) and 'Article unique' not in line:
-            continue
-
-        if re_stars.match(line):
-            continue
+    for html, line in blocks:
         if line == "<b>RAPPORT</b>" or line == "Mesdames, Messieurs,":
             read = -1
         if (srclst or indextext != -1) and re_sep_text.match(line):
@@ -519,28 +793,18 @@ def parse(url, resp=None):
                     break
         elif re_mat_ppl.match(line) or re_mat_tco.match(line):
             read = 0
-            texte = save_text(texte)
+            yield from save_text(texte)
         elif re_mat_exp.match(line):
             read = -1 # Deactivate description lecture
             expose = True
         elif read == 0 and definitif_before_congres in line or definitif_after_congres in line:
             texte['definitif'] = True
-            if all_articles:
-                all_articles[0]['definitif'] = True
+            if first_record is not None:
+                first_record['definitif'] = True
             continue
-        elif (re_echec_cmp.search(cl_line)
-                or re_echec_com.search(cl_line)
-                or re_echec_com2.search(cl_line)
-                or re_echec_com3.search(cl_line)
-                or re_echec_com4.search(cl_line)
-                or re_echec_com5.search(cl_line)
-                or re_echec_com6.search(cl_line)
-                or re_echec_hemi.match(cl_line)
-                or re_echec_hemi2.search(cl_line)
-                or re_echec_hemi3.search(cl_line)
-            ) and 'dont la teneur suit' not in cl_line:
-            texte = save_text(texte)
-            pr_js({"type": "echec", "texte": cl_line})
+        elif is_echec(cl_line) and 'dont la teneur suit' not in cl_line:
+            yield from save_text(texte)
+            yield from pr_js({"type": "echec", "texte": cl_line})
             break
         elif read == -1 or (indextext != -1 and curtext != indextext):
             continue
@@ -554,7 +818,7 @@ def parse(url, resp=None):
             cl_line = cl_line.replace('(Conforme)', '')
 
         # Identify section zones
-        line = normalize_section_title(line, text, has_multiple_expose)
+        line = normalize_section_title(line, html, has_multiple_expose)
         m = re_mat_sec.match(line)
         if m:
             read = 1 # Activate titles lecture
@@ -584,12 +848,12 @@ def parse(url, resp=None):
 
             titre = blank_none(m.group('titre')).strip()
             if titre:
-                texte = save_text(texte)
+                yield from save_text(texte)
                 section['titre'] = titre
                 if article is not None:
-                    pr_js(article)
+                    yield from pr_js(article)
                     article = None
-                pr_js(section)
+                yield from pr_js(dict(section))
                 read = 0
         # Identify titles and new article zones
         elif (not expose and re_mat_end.match(line)) or (read == 2 and re_mat_ann.match(line)):
@@ -601,8 +865,8 @@ def parse(url, resp=None):
             # Read a new article
             if re_mat_art.match(line):
                 if article is not None:
-                    texte = save_text(texte)
-                    pr_js(article)
+                    yield from save_text(texte)
+                    yield from pr_js(article)
                 read = 2 # Activate alineas lecture
                 expose = False
                 art_num += 1
@@ -610,7 +874,7 @@ def parse(url, resp=None):
                 article = {"type": "article", "order": art_num, "alineas": {}, "statut": "none"}
                 if srclst:
                     article["source_text"] = srclst[curtext]
-                m = re_mat_art.match(clean_article_name(text))
+                m = re_mat_art.match(clean_article_name(html))
                 article["titre"] = normalize_1(m.group(1), "1er")
 
                 assert article["titre"]  # avoid empty titles
@@ -622,22 +886,22 @@ def parse(url, resp=None):
                     article["section"] = section["id"]
             # Read a section's title
             elif read == 1 and line:
-                texte = save_text(texte)
+                yield from save_text(texte)
                 section["titre"] = lower_but_first(line)
                 if article is not None:
-                    pr_js(article)
+                    yield from pr_js(article)
                     article = None
-                pr_js(section)
+                yield from pr_js(dict(section))
                 read = 0
 
         # detect dots, used as hints for later completion
-        if read != -1 and len(all_articles) > 0:
+        if read != -1 and first_record is not None:
             if re_mat_dots.match(line):
                 if article is not None:
-                    texte = save_text(texte)
-                    pr_js(article)
+                    yield from save_text(texte)
+                    yield from pr_js(article)
                     article = None
-                pr_js({"type": "dots"})
+                yield from pr_js({"type": "dots"})
                 read = 0
                 continue
 
@@ -683,14 +947,23 @@ def parse(url, resp=None):
             continue
 
     if article is not None:
-        save_text(texte)
-        pr_js(article)
-
-    return all_articles
+        yield from save_text(texte)
+        yield from pr_js(article)
 
 
 if __name__ == '__main__':
-    if '--test' not in sys.argv:
+    if '--profile-regexps' in sys.argv:
+        try:
+            from . import regex_profile
+        except (SystemError, ImportError):
+            import regex_profile
+        regex_profile.enable(sys.modules[__name__])
+        # the texts are parsed without printing them
+        for url in sys.argv[1:]:
+            if not url.startswith('--'):
+                parse(url)
+        regex_profile.report()
+    elif '--test' not in sys.argv:
         print_json(parse(sys.argv[1]))
     else:
         def assert_eq(x, y):
@@ -702,6 +975,13 @@ if __name__ == '__main__':
         # but remove them for status
         assert_eq(clean_html('...........Conforme.........'), 'Conforme')
         assert_eq(clean_html('...……......……..Conforme....……...…….'), 'Conforme')
+        # the single characters
+        assert_eq(clean_html('l’article\xa02 − «\xa0texte\xa0» — “a” ‑ b'), 'l\'article 2 - "texte" - "a" - b')
+        # the échecs
+        assert is_echec("La commission mixte paritaire n'est pas parvenue à élaborer un texte commun.")
+        assert is_echec("LE SÉNAT DÉCIDE QU'IL N'Y A PAS LIEU DE POURSUIVRE LA DÉLIBÉRATION")
+        assert is_echec("Le Sénat a rejeté, en nouvelle lecture, le projet de loi")
+        assert not is_echec("En conséquence, le Sénat a rejeté le projet de loi")
         # even with spaces
         assert_eq(clean_html('...........  Conforme   .........'), 'Conforme')
         # or for alineas
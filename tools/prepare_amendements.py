@@ -3,18 +3,143 @@ import sys
 from time import time
 from functools import cmp_to_key
 
-from lawfactory_utils.urls import download
-
 try:
     from .common import *
+    from .downloader import download, get_prefetched
+    from . import nos_api, reference_data
+    from .nos_api import seances_url, seance_url
     from .sort_articles import compare_articles
     from tools._step_logic import get_previous_step
 except SystemError:
     from common import *
+    from downloader import download, get_prefetched
+    import nos_api, reference_data
+    from nos_api import seances_url, seance_url
     from sort_articles import compare_articles
     from _step_logic import get_previous_step
 
 
+def cache_busting(procedure):
+    if 'url_jo' in procedure:
+        return 'cache=5feb2018' # fixed cache busting for promulgated laws
+    return 'cache=%d' % time()
+
+
+def find_texte_url(steps, i, procedure, verbose=True):
+    """returns the url of the text the amendments of the step `i` are made on
+    and the previous step, (None, None) if there's none"""
+    step = steps[i]
+    if step.get('step') not in ('commission', 'hemicycle'):
+        return None, None
+    if step.get('step') == 'commission' and step.get('stage') == 'CMP':
+        return None, None
+
+    if i == 0:
+        return None, None
+
+    last_step_index = get_previous_step(steps, i, is_old_procedure=procedure.get('use_old_procedure'))
+    last_step = steps[last_step_index]
+    last_step_with_good_text_number = steps[get_previous_step(steps, i,
+        is_old_procedure=procedure.get('use_old_procedure'), get_depot_step=True)
+    ]
+    texte_url = last_step_with_good_text_number.get('source_url')
+
+    if step.get('stage') != 'CMP' and last_step_with_good_text_number.get('institution') != step.get('institution'):
+        if verbose:
+            print('ERROR - last step is from another institution', file=sys.stderr)
+        return None, None
+
+    # for a CMP hemicycle we have to get the right text inside the CMP commission
+    if step.get('stage') == 'CMP' and step.get('step') == 'hemicycle':
+        urls = [last_step.get('source_url')]
+        if 'cmp_commission_other_url' in last_step:
+            urls.append(last_step.get('cmp_commission_other_url'))
+        an_url = [url for url in urls if 'nationale.fr' in url]
+        senat_url = [url for url in urls if 'senat.fr' in url]
+        if step.get('institution') == 'assemblee' and an_url:
+            texte_url = an_url[0]
+        elif step.get('institution') == 'senat' and senat_url:
+            texte_url = senat_url[0]
+        else:
+            if verbose:
+                print('WARNING - missing the CMP commission text for', step.get('source_url'), file=sys.stderr)
+            return None, None
+
+    if texte_url is None:
+        if verbose:
+            print('ERROR - no texte url', step.get('source_url'), file=sys.stderr)
+        return None, None
+
+    return texte_url, last_step
+
+
+def amendements_url(texte_url, procedure, cache_param):
+    if "nationale.fr" in texte_url:
+        return 'https://nosdeputes.fr/%s/amendements/%s/json?%s' % (procedure.get('assemblee_legislature'), get_text_id(texte_url), cache_param)
+    elif "senat.fr" in texte_url:
+        return 'https://nossenateurs.fr/amendements/%s/json?%s' % (get_text_id(texte_url), cache_param)
+
+
+def alternative_amendements_url(amdt_url, texte_url):
+    """TA texts can be zero-paded or not (TA0XXX or TAXXX), returns the other form"""
+    if 'amendements/TA' not in amdt_url:
+        return None
+    textid = get_text_id(texte_url)
+    if 'TA0' in textid:
+        return amdt_url.replace(textid, 'TA' + textid.replace('TA', '').lstrip('0'))
+    return amdt_url.replace(textid, 'TA' + textid.replace('TA', '').zfill(4))
+
+
+def _planned_steps(procedure):
+    steps = procedure['steps']
+    for i, step in enumerate(steps):
+        try:
+            texte_url, _ = find_texte_url(steps, i, procedure, verbose=False)
+            if texte_url is None or ("nationale.fr" in texte_url and 'assemblee_legislature' not in procedure):
+                continue
+            amdt_url = amendements_url(texte_url, procedure, '')
+            if amdt_url is None:
+                continue
+            amdt_urls = nos_api.amendements_urls(amdt_url, alternative_amendements_url(amdt_url, texte_url))
+            typeparl, urlapi = identify_room(texte_url,
+                legislature=step.get('assemblee_legislature', procedure.get('assemblee_legislature')))
+            yield step, get_text_id(texte_url), urlapi, amdt_urls
+        except Exception:
+            # the plan is only a guess, `process` will tell what's wrong
+            continue
+
+
+def remote_urls(procedure):
+    """urls of the amendments and seances lists that `process` will download"""
+    urls = []
+    for step, loiid, urlapi, amdt_urls in _planned_steps(procedure):
+        urls += amdt_urls
+        urls.append(seances_url(urlapi, loiid, step))
+    return urls
+
+
+def followup_urls(procedure, context):
+    """
+    urls of the seances and missing parlementaires found in the
+    already prefetched responses of `remote_urls`
+    """
+    urls = []
+    for step, loiid, urlapi, amdt_urls in _planned_steps(procedure):
+        resp = get_prefetched(seances_url(urlapi, loiid, step))
+        if resp is not None and resp.status_code == 200:
+            for id_seance_obj in resp.json().get('seances', []):
+                urls.append(seance_url(urlapi, id_seance_obj['seance'], loiid))
+        for amdt_url in amdt_urls:
+            resp = get_prefetched(amdt_url)
+            if resp is None or resp.status_code != 200:
+                continue
+            for amd in resp.json().get('amendements', []):
+                for parll in amd['amendement'].get('parlementaires', []):
+                    if parll['parlementaire'] not in context.parlementaires.get(urlapi, {}):
+                        urls.append(parl_link(parll['parlementaire'], urlapi) + "/json")
+    return urls
+
+
 def process(OUTPUT_DIR, procedure):
     context = Context([0, OUTPUT_DIR], load_parls=True)
 
@@ -105,79 +230,37 @@ def process(OUTPUT_DIR, procedure):
         return amendements
 
 
-    CACHE_BUSTING = 'cache=%d' % time()
-    if 'url_jo' in procedure:
-        CACHE_BUSTING = 'cache=5feb2018' # fixed cache busting for promulgated laws
+    CACHE_BUSTING = cache_busting(procedure)
     steps = {}
     last_text_id, last_text_typeparl = None, None
     steps = procedure['steps']
     for i, step in enumerate(steps):
         print('    * step -', step.get('stage'), step.get('step'), step.get('source_url'))
-        if step.get('step') not in ('commission', 'hemicycle'):
-            continue
-        if step.get('step') == 'commission' and step.get('stage') == 'CMP':
-            continue
-
-        if i == 0:
-            continue
-
-        last_step_index = get_previous_step(steps, i, is_old_procedure=procedure.get('use_old_procedure'))
-        last_step = steps[last_step_index]
-        last_step_with_good_text_number = steps[get_previous_step(steps, i,
-            is_old_procedure=procedure.get('use_old_procedure'), get_depot_step=True)
-        ]
-        texte_url = last_step_with_good_text_number.get('source_url')
-
-        if step.get('stage') != 'CMP' and last_step_with_good_text_number.get('institution') != step.get('institution'):
-            print('ERROR - last step is from another institution', file=sys.stderr)
-            continue
-
-        # for a CMP hemicycle we have to get the right text inside the CMP commission
-        if step.get('stage') == 'CMP' and step.get('step') == 'hemicycle':
-            urls = [last_step.get('source_url')]
-            if 'cmp_commission_other_url' in last_step:
-                urls.append(last_step.get('cmp_commission_other_url'))
-            an_url = [url for url in urls if 'nationale.fr' in url]
-            senat_url = [url for url in urls if 'senat.fr' in url]
-            if step.get('institution') == 'assemblee' and an_url:
-                texte_url = an_url[0]
-            elif step.get('institution') == 'senat' and senat_url:
-                texte_url = senat_url[0]
-            else:
-                print('WARNING - missing the CMP commission text for', step.get('source_url'), file=sys.stderr)
-                continue
-
+        texte_url, last_step = find_texte_url(steps, i, procedure)
         if texte_url is None:
-            print('ERROR - no texte url', step.get('source_url'), file=sys.stderr)
             continue
 
         texte = open_json(os.path.join(context.sourcedir, 'procedure', last_step['directory']), 'texte/texte.json')
 
-        amdt_url = None
-        if "nationale.fr" in texte_url:
-            if 'assemblee_legislature' not in procedure:
-                print('         + no AN legislature - pass text')
-                continue
-            amdt_url = 'https://nosdeputes.fr/%s/amendements/%s/json?%s' % (procedure.get('assemblee_legislature'), get_text_id(texte_url), CACHE_BUSTING)
-        elif "senat.fr" in texte_url:
-            amdt_url = 'https://nossenateurs.fr/amendements/%s/json?%s' % (get_text_id(texte_url), CACHE_BUSTING)
+        if "nationale.fr" in texte_url and 'assemblee_legislature' not in procedure:
+            print('         + no AN legislature - pass text')
+            continue
+        amdt_url = amendements_url(texte_url, procedure, CACHE_BUSTING)
 
         if amdt_url is None:
             continue
 
         print('      * downloading amendments:', amdt_url, 'for', texte_url)
 
-        amendements_src = download(amdt_url).json().get('amendements', [])
-
         # TA texts can be zero-paded or not (TA0XXX or TAXXX), we try both
-        if 'amendements/TA' in amdt_url:
-            textid = get_text_id(texte_url)
-            if 'TA0' in textid:
-                alternative_url = amdt_url.replace(textid, 'TA' + textid.replace('TA', '').lstrip('0'))
-            else:
-                alternative_url = amdt_url.replace(textid, 'TA' + textid.replace('TA', '').zfill(4))
+        alternative_url = alternative_amendements_url(amdt_url, texte_url)
+
+        amendements_by_url = nos_api.amendements(nos_api.amendements_urls(amdt_url, alternative_url))
+        amendements_src = amendements_by_url.get(amdt_url, [])
+
+        if alternative_url:
             print(' WARNING: TA - trying alternative url too', alternative_url)
-            amendements_src += download(alternative_url).json().get('amendements', [])
+            amendements_src += amendements_by_url.get(alternative_url, [])
 
         print('        parsing amendments:', len(amendements_src))
 
@@ -221,6 +304,10 @@ def process(OUTPUT_DIR, procedure):
             typeparl, urlapi = identify_room(texte_url,
                 legislature=step.get('assemblee_legislature', procedure.get('assemblee_legislature')))
 
+            # the parlementaires missing from the reference data are downloaded together
+            reference_data.prefetch_parlementaires(context.api_directory, {urlapi: [parll['parlementaire']
+                for amd in amendements_src for parll in amd['amendement'].get('parlementaires', [])]})
+
             sujets = {}
             groupes = {}
 
@@ -322,7 +409,6 @@ def process(OUTPUT_DIR, procedure):
         typeparl, urlapi = identify_room(texte_url,
             legislature=step.get('assemblee_legislature', procedure.get('assemblee_legislature')))
         inter_dir = os.path.join(context.sourcedir, 'procedure', step['directory'], 'interventions')
-        commission_or_hemicycle = '?commission=1' if step.get('step') == 'commission' else '?hemicycle=1'
         # TODO: TA texts can be zero-paded or not (TA0XXX or TAXXX), we should try both
         seance_name = None
         intervention_files = []
@@ -332,12 +418,11 @@ def process(OUTPUT_DIR, procedure):
             texts = (get_text_id(texte_url), last_text_id)
 
         for loiid in texts:
-            url_seances = 'https://{}.fr/seances/{}/json{}'.format(urlapi, loiid, commission_or_hemicycle)
+            url_seances = seances_url(urlapi, loiid, step)
             print('        * downloading seances - ', url_seances)
-            for id_seance_obj in sorted(download(url_seances).json().get('seances', []), key=lambda x: x["seance"]):
-                url_seance = 'https://{}.fr/seance/{}/{}/json'.format(urlapi, id_seance_obj['seance'], loiid)
-                print('           downloading seance - ', url_seance)
-                resp = download(url_seance).json()
+            for seance_id, resp in nos_api.seances(urlapi, loiid, step):
+                print('           downloading seance - ', seance_url(urlapi, seance_id, loiid))
+                resp = resp.json()
                 if resp.get('seance'):
                     inter = resp.get('seance')[0]['intervention']
                     seance_name = inter['date'] + 'T' + inter['heure'] + '_' + inter['seance_id']
@@ -7,9 +7,11 @@ from functools import cmp_to_key
 try:
     from .common import open_json, print_json, clean_text_for_diff, compute_similarity, format_display_date
     from .sort_articles import compare_articles
+    from . import spill
 except:
     from common import open_json, print_json, clean_text_for_diff, compute_similarity, format_display_date
     from sort_articles import compare_articles
+    import spill
 
 from tools import _step_logic
 
@@ -104,7 +106,7 @@ def process(procedure):
     step_id = ''
     old_step_index = None
     for nstep, step in enumerate(steps):
-        data = step.get('texte.json')
+        data = spill.get(step, 'texte.json')
         if step['stage'] == 'promulgation':
             continue
         if not data and not step.get('echec'):
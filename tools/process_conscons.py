@@ -1,11 +1,14 @@
 import re
 import sys
+from functools import lru_cache
 
 try:
     from common import strip_text
+    from downloader import download
 except:
     from .common import strip_text
-from lawfactory_utils.urls import download, enable_requests_cache
+    from .downloader import download
+from lawfactory_utils.urls import enable_requests_cache
 
 # TODO:
 # - parse by <p>
@@ -16,26 +19,48 @@ from lawfactory_utils.urls import download, enable_requests_cache
 # - return list of considerants
 # - return list of decision articles
 
-re_delibere = re.compile(r"<p>\s*(Jug|Délibér)é par le Conseil constitutionnel .*$", re.S)
-clean_delib = lambda x: re_delibere.sub("", x)
+VISA = '<a name=\'visa\' id="visa"></a>'
+# only the beginning is searched, the end of the page is then cut
+re_delibere = re.compile(r"<p>\s*(Jug|Délibér)é par le Conseil constitutionnel ")
+
+
+class CCDecision:
+    """a decision of the Conseil constitutionnel, downloaded once and parsed when needed"""
+
+    def __init__(self, url):
+        self.url = url
+        self.html = download(url).text
+        self._decision = False
+
+    @property
+    def decision(self):
+        if self._decision is False:
+            self._decision = None
+            if VISA not in self.html:
+                print("ERROR: could not find visa in decision CC", self.url, file=sys.stderr)
+                return None
+            decision_txt = self.html.split(VISA)[1]
+            delibere = re_delibere.search(decision_txt)
+            if not delibere:
+                print("ERROR: could not find siège in décision CC", self.url, file=sys.stderr)
+                return None
+            self._decision = strip_text(decision_txt[:delibere.start()])
+        return self._decision
+
+    @property
+    def decision_length(self):
+        return len(self.decision) if self.decision else -1
+
+
+@lru_cache(maxsize=16)
+def analyze(url):
+    return CCDecision(url)
 
 def extract_full_decision(url):
-    decision_src = download(url).text
-    if '<a name=\'visa\' id="visa"></a>' not in decision_src:
-        print("ERROR: could not find visa in decision CC", url, file=sys.stderr)
-        return None
-    decision_txt = decision_src.split('<a name=\'visa\' id="visa"></a>')[1]
-    if not re_delibere.search(decision_txt):
-        print("ERROR: could not find siège in décision CC", url, file=sys.stderr)
-        return None
-    decision_txt = clean_delib(decision_txt)
-    return strip_text(decision_txt)
+    return analyze(url).decision
 
 def get_decision_length(url):
-    decision_txt = extract_full_decision(url)
-    if not decision_txt:
-        return -1
-    return len(decision_txt)
+    return analyze(url).decision_length
 
 if __name__ == "__main__":
     enable_requests_cache()
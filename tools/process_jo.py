@@ -1,11 +1,14 @@
 import re
 import sys
+from functools import lru_cache
 
 try:
     from common import strip_text
+    from downloader import download
 except:
     from .common import strip_text
-from lawfactory_utils.urls import download, enable_requests_cache
+    from .downloader import download
+from lawfactory_utils.urls import enable_requests_cache
 
 # TODO:
 # - count articles
@@ -15,45 +18,127 @@ re_br = re.compile(r"[\s\n\r]*</?br[^>]*>[\s\n\r]*", re.S)
 clean_br = lambda x: re_br.sub("\n", x)
 re_fioritures = re.compile(r"(<div[^>]*>[\s\n]*</div>|<a[^>]*>En savoir plus sur [^<]*</a>|Fait à [^,]+, le \d[^.,]*, en double exemplaire\.)")
 clean_fioritures = lambda x: re_fioritures.sub("", x)
-re_texte = re.compile(r"^.*Le Président (?:de la République (?:française )?)?promulgue la loi dont la teneur suit :(.*?)(La présente loi sera exécutée comme loi de l'Etat\.|<!-- end texte -->|Fait(?: (?:à|au) [^,]+,)? le \d.*?<[^>]*>).*$", re.S|re.I)
-extract_contenu = lambda x: re_texte.sub(r"\1", x)
-re_reorder = re.compile(r"(Fait(?: (?:à|au) [^,]+,)? le \d.*?<[^>]*>)(.*)(<!-- end texte -->.*Par le Président de la République :)", re.S)
-reorder = lambda x: re_reorder.sub(r"\2\1\3", x)
-re_signataires = re.compile(r"^.*?((<!-- end texte -->|Fait(?: (?:à|au) [^,]+,)? le \d.*?<[^>]*>).*?)<(font|!-- end signataires).*$", re.S)
-signataires = lambda x: re_signataires.sub(r"\1", x)
+# the markers are searched one after the other from a known position instead
+# of matching the whole page with a single regex, which backtracked a lot on
+# long laws
+re_promulgue = re.compile(r"Le Président (?:de la République (?:française )?)?promulgue la loi dont la teneur suit :", re.I)
+re_fin_texte = re.compile(r"La présente loi sera exécutée comme loi de l'Etat\.|<!-- end texte -->|Fait(?: (?:à|au) [^,]+,)? le \d.*?<[^>]*>", re.S|re.I)
+re_fait = re.compile(r"Fait(?: (?:à|au) [^,]+,)? le \d.*?<[^>]*>", re.S)
+re_debut_signataires = re.compile(r"<!-- end texte -->|Fait(?: (?:à|au) [^,]+,)? le \d.*?<[^>]*>", re.S)
+re_fin_signataires = re.compile(r"<(font|!-- end signataires)")
 re_ministre = re.compile(r"le Président de la République|L[ea] (Premi[eè]re?|ministre|garde|secrétaire|haut-commissaire) ")
 count_ministres = lambda x: len(re_ministre.findall(x))
 
+
+def last_start(regex, text):
+    """the position of the last match of the regex, the overlapping ones included"""
+    last = None
+    match = regex.search(text)
+    while match:
+        last = match.start()
+        match = regex.search(text, match.start() + 1)
+    return last
+
+
+def find_contenu(text):
+    """the text between the last promulgation formula followed by an end of law and this end"""
+    last_fin = last_start(re_fin_texte, text)
+    debut = None
+    if last_fin is not None:
+        for match in re_promulgue.finditer(text):
+            if match.end() > last_fin:
+                break
+            debut = match
+    if not debut:
+        return None
+    return text[debut.end():re_fin_texte.search(text, debut.end()).start()]
+
+
+def reorder(text):
+    """move the "Fait à ..." after the text, before the signataires"""
+    par_le_president = text.rfind("Par le Président de la République :")
+    fin_texte = text.rfind("<!-- end texte -->", 0, par_le_president) if par_le_president >= 0 else -1
+    fait = re_fait.search(text)
+    while fait and fait.end() > fin_texte:
+        fait = re_fait.search(text, fait.start() + 1)
+    if not fait:
+        return text
+    return text[:fait.start()] + text[fait.end():fin_texte] + fait.group(0) + text[fin_texte:]
+
+
+def find_signataires(text):
+    fins = [fin.start() for fin in re_fin_signataires.finditer(text)]
+    if not fins:
+        return None
+    # the first beginning followed by an end
+    debut = re_debut_signataires.search(text)
+    while debut and debut.end() > fins[-1]:
+        debut = re_debut_signataires.search(text, debut.start() + 1)
+    if not debut:
+        return None
+    return text[debut.start():re_fin_signataires.search(text, debut.end()).start()]
+
+
 def download_texte(url):
     text = download(url).text
     return clean_fioritures(clean_br(text))
 
+
+class JODocument:
+    """a law published in the JO, downloaded once and parsed when needed"""
+
+    def __init__(self, url):
+        self.url = url
+        self.html = download_texte(url)
+        self._texte = self._signataires = False
+
+    @property
+    def texte(self):
+        if self._texte is False:
+            contenu = find_contenu(self.html)
+            if contenu is None:
+                print("ERROR: could not find texte in JO", self.url, file=sys.stderr)
+                self._texte = None
+            else:
+                self._texte = strip_text(contenu)
+        return self._texte
+
+    @property
+    def signataires(self):
+        if self._signataires is False:
+            text_src = find_signataires(reorder(self.html))
+            if text_src is None:
+                print("ERROR: could not find signature in texte JO", self.url, file=sys.stderr)
+                self._signataires = None
+            else:
+                self._signataires = strip_text(text_src)
+        return self._signataires
+
+    @property
+    def texte_length(self):
+        return len(self.texte) if self.texte else -1
+
+    @property
+    def signataires_count(self):
+        return count_ministres(self.signataires) if self.signataires else -1
+
+
+@lru_cache(maxsize=16)
+def analyze(url):
+    """the JODocument of an url, the metrics of a dosleg ask for the same one several times"""
+    return JODocument(url)
+
 def extract_texte(url):
-    text = download_texte(url)
-    if not re_texte.search(text):
-        print("ERROR: could not find texte in JO", url, file=sys.stderr)
-        return None
-    return strip_text(extract_contenu(text))
+    return analyze(url).texte
 
 def get_texte_length(url):
-    text = extract_texte(url)
-    if not text:
-        return -1
-    return len(text)
+    return analyze(url).texte_length
 
 def extract_signataires(url):
-    text_src = reorder(download_texte(url))
-    if not re_signataires.search(text_src):
-        print("ERROR: could not find signature in texte JO", url, file=sys.stderr)
-        return None
-    text_src = signataires(text_src)
-    return strip_text(text_src)
+    return analyze(url).signataires
 
 def count_signataires(url):
-    signataires_text = extract_signataires(url)
-    if not signataires_text:
-        return -1
-    return count_ministres(signataires_text)
+    return analyze(url).signataires_count
 
 if __name__ == "__main__":
     enable_requests_cache()
@@ -0,0 +1,279 @@
+"""
+Reference data shared by all the doslegs parsed by a process: the groupes
+and the parlementaires of NosDéputés/NosSénateurs and the "lois dites"
+
+`get()` loads them once per process, the files are then checked in the
+background every REFRESH_INTERVAL and downloaded again when they are more
+than a day old. The files are indexed by slug in reference_data.pickle in
+the api directory, it's rebuilt when one of them changes so a process only
+reads this small file.
+
+The parlementaires missing from the files are downloaded together by
+`prefetch_parlementaires()` and kept in parlementaires_extra.json.
+
+The records read by the dosleg being parsed (the groupes, its parlementaires
+and its loi dite) are noted, `used_records()` returns them by name for its
+fingerprint.
+"""
+import json, os, pickle, sys, threading, time
+
+try:
+    from .downloader import download, prefetch
+    from .download_groupes import process as download_groupes
+    from . import archive
+except ImportError:
+    from downloader import download, prefetch
+    from download_groupes import process as download_groupes
+    import archive
+
+REFRESH_INTERVAL = 3600
+
+# the fields of a parlementaire used by prepare_amendements
+PARLEMENTAIRE_FIELDS = ('id', 'slug', 'nom', 'groupe_sigle', 'place_en_hemicycle')
+
+_data = {}
+_lock = threading.RLock()
+_refreshers = set()
+# the records used by the dosleg being parsed, {record name: record}
+_used = {}
+
+
+def slug_groupe(g):
+    g = g.upper()
+    g = g.replace("SOCV", "SOC")
+    g = g.replace("CRC-SPG", "CRC")
+    g = g.replace("ECOLO", "ECO")
+    g = g.replace("ECO", "ECOLO")
+    return g
+
+
+def index_file(api_directory):
+    return os.path.join(api_directory, 'reference_data.pickle')
+
+
+def extra_parlementaires_file(api_directory):
+    return os.path.join(api_directory, 'parlementaires_extra.json')
+
+
+def source_files(api_directory):
+    return [os.path.join(api_directory, f) for f in sorted(os.listdir(api_directory))
+        if f.endswith('-groupes.json') or f.endswith('.parlementaires.json')
+            or f in ('lois_dites.json', 'parlementaires_extra.json')]
+
+
+def write_atomically(path, content, mode='w'):
+    tmpfile = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmpfile, mode) as f:
+        f.write(content)
+    os.replace(tmpfile, path)
+
+
+def project(parlementaire):
+    return {field: parlementaire.get(field) for field in PARLEMENTAIRE_FIELDS}
+
+
+def read_groupes(path):
+    groupes = {}
+    with open(path) as f:
+        for gpe in json.load(f)['organismes']:
+            if not gpe["organisme"]["acronyme"]:
+                continue
+            acro = slug_groupe(gpe["organisme"]["acronyme"])
+            groupes[acro] = {
+                "nom": gpe["organisme"]['nom'],
+                "order": int(gpe["organisme"]['order']),
+                "color": "rgb(%s)" % gpe["organisme"]['couleur']}
+    return groupes
+
+
+def read_parlementaires(path, urlapi):
+    typeparl = "depute" if "depute" in urlapi else "senateur"
+    with open(path) as f:
+        return {parl[typeparl]["slug"]: project(parl[typeparl]) for parl in json.load(f)[typeparl + "s"]}
+
+
+def build_index(api_directory):
+    data = {'groupes': {}, 'parlementaires': {}, 'lois_dites': {}}
+    for path in source_files(api_directory):
+        f = os.path.basename(path)
+        try:
+            if f.endswith('-groupes.json'):
+                data['groupes'][f.replace('-groupes.json', '').lower()] = read_groupes(path)
+            elif f.endswith('.parlementaires.json'):
+                urlapi = f.replace('.parlementaires.json', '').lower()
+                data['parlementaires'].setdefault(urlapi, {}).update(read_parlementaires(path, urlapi))
+            elif f == 'lois_dites.json':
+                with open(path) as fd:
+                    data['lois_dites'] = json.load(fd)
+        except Exception as e:
+            sys.stderr.write('WARNING: could not read reference file %s in data\n' % f)
+            sys.stderr.write('%s: %s\n' % (type(e), e))
+    # the missing parlementaires downloaded earlier, the files have precedence
+    path = extra_parlementaires_file(api_directory)
+    if os.path.exists(path):
+        with open(path) as f:
+            for urlapi, parls in json.load(f).items():
+                for slug, parl in parls.items():
+                    data['parlementaires'].setdefault(urlapi, {}).setdefault(slug, parl)
+    write_atomically(index_file(api_directory), pickle.dumps(data, pickle.HIGHEST_PROTOCOL), 'wb')
+    return data
+
+
+def load(api_directory):
+    """the indexed data, the index is rebuilt if a file changed since"""
+    path = index_file(api_directory)
+    sources = source_files(api_directory)
+    if os.path.exists(path) and all(os.path.getmtime(f) <= os.path.getmtime(path) for f in sources):
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+    return build_index(api_directory)
+
+
+def download_files(api_directory, verbose=True):
+    # imported here since legipy is only needed to download the lois dites
+    try:
+        from .download_lois_dites import process as download_lois_dites
+    except ImportError:
+        from download_lois_dites import process as download_lois_dites
+    download_groupes(api_directory, verbose=verbose)
+    download_lois_dites(api_directory)
+
+
+def refresh(api_directory, verbose=True):
+    # offline, the files already there are used
+    if not archive.offline():
+        download_files(api_directory, verbose=verbose)
+    data = load(api_directory)
+    with _lock:
+        _data[api_directory] = data
+    return data
+
+
+def refresh_in_background(api_directory):
+    while True:
+        time.sleep(REFRESH_INTERVAL)
+        try:
+            refresh(api_directory, verbose=False)
+        except Exception as e:
+            sys.stderr.write('WARNING: could not refresh the reference data: %s: %s\n' % (type(e), e))
+
+
+def get(api_directory, download_missing=True):
+    """
+    the reference data of the api directory: {'groupes': {urlapi: {acronym: groupe}},
+    'parlementaires': {urlapi: {slug: parlementaire}}, 'lois_dites': {id_legi: name}}
+    """
+    api_directory = os.path.normpath(api_directory)
+    with _lock:
+        if api_directory not in _data:
+            if download_missing:
+                refresh(api_directory)
+            else:
+                _data[api_directory] = load(api_directory)
+        # a forked worker relies on the thread of its parent, and gets the
+        # refreshed data when it's recycled
+        if download_missing and api_directory not in _refreshers:
+            _refreshers.add(api_directory)
+            threading.Thread(target=refresh_in_background, args=(api_directory,), daemon=True).start()
+        return _data[api_directory]
+
+
+def record_name(kind, *keys):
+    """'parlementaires/nosdeputes/jean-dupont', see `find_record()`"""
+    return '/'.join((kind,) + keys)
+
+
+def find_record(data, name):
+    """the record of the data with this name, or None"""
+    record = data
+    for key in name.split('/'):
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+def use(name, record):
+    with _lock:
+        _used[name] = record
+
+
+def used_records():
+    with _lock:
+        return dict(_used)
+
+
+def clear_used():
+    with _lock:
+        _used.clear()
+
+
+def get_groupes(api_directory):
+    """the groupes of each urlapi, they are all used by the dosleg"""
+    groupes = get(api_directory, download_missing=False)['groupes']
+    for urlapi, groupes_of_urlapi in groupes.items():
+        use(record_name('groupes', urlapi), groupes_of_urlapi)
+    return groupes
+
+
+def get_loi_dite(api_directory, cid_texte):
+    """the common name of a law from the lois dites, or None"""
+    if not cid_texte:
+        return None
+    loi_dite = get(api_directory)['lois_dites'].get(cid_texte)
+    use(record_name('lois_dites', cid_texte), loi_dite)
+    return loi_dite
+
+
+def parlementaire_url(urlapi, slug):
+    return 'https://%s.fr/%s/json' % (urlapi, slug)
+
+
+def fetch_parlementaire(urlapi, slug):
+    typeparl = "depute" if "deputes" in urlapi else "senateur"
+    return project(download(parlementaire_url(urlapi, slug)).json()[typeparl])
+
+
+def save_extra_parlementaires(api_directory, found):
+    path = extra_parlementaires_file(api_directory)
+    with _lock:
+        extra = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                extra = json.load(f)
+        for urlapi, parls in found.items():
+            extra.setdefault(urlapi, {}).update(parls)
+        write_atomically(path, json.dumps(extra, ensure_ascii=False, sort_keys=True, indent=2))
+
+
+def prefetch_parlementaires(api_directory, slugs_by_urlapi):
+    """download together the parlementaires missing from the data and keep them"""
+    data = get(api_directory, download_missing=False)
+    missing = [(urlapi, slug) for urlapi, slugs in slugs_by_urlapi.items()
+        for slug in set(slugs) if slug not in data['parlementaires'].get(urlapi, {})]
+    if not missing:
+        return
+    prefetch([parlementaire_url(urlapi, slug) for urlapi, slug in missing])
+    found = {}
+    for urlapi, slug in missing:
+        try:
+            parl = fetch_parlementaire(urlapi, slug)
+        except Exception:
+            # `get_parlementaire` will tell what's wrong if it's needed
+            continue
+        data['parlementaires'].setdefault(urlapi, {})[slug] = parl
+        found.setdefault(urlapi, {})[slug] = parl
+    if found:
+        save_extra_parlementaires(api_directory, found)
+
+
+def get_parlementaire(api_directory, urlapi, slug):
+    parls = get(api_directory, download_missing=False)['parlementaires'].setdefault(urlapi, {})
+    if slug not in parls:
+        parls[slug] = fetch_parlementaire(urlapi, slug)
+        save_extra_parlementaires(api_directory, {urlapi: {slug: parls[slug]}})
+    use(record_name('parlementaires', urlapi, slug), parls[slug])
+    return parls[slug]
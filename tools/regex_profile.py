@@ -0,0 +1,84 @@
+"""
+Time spent in each regexp of a module, for parse_texte.py --profile-regexps
+
+`enable(module)` replaces the compiled regexps of the module, including the
+ones in its lists of (regexp, replacement), by timed ones. `report()` prints
+the regexps sorted by the time spent in them.
+"""
+import os, re, sys, time
+
+Pattern = type(re.compile(''))
+
+_stats = {}
+
+
+class TimedRegex:
+    def __init__(self, name, regex):
+        self.name = name
+        self.regex = regex
+        _stats.setdefault(name, [regex.pattern, 0, 0.0])
+
+    def __getattr__(self, attr):
+        return getattr(self.regex, attr)
+
+    def __repr__(self):
+        return repr(self.regex)
+
+    def timed(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return getattr(self.regex, method)(*args, **kwargs)
+        finally:
+            stats = _stats[self.name]
+            stats[1] += 1
+            stats[2] += time.perf_counter() - start
+
+    def sub(self, *args, **kwargs):
+        return self.timed('sub', *args, **kwargs)
+
+    def subn(self, *args, **kwargs):
+        return self.timed('subn', *args, **kwargs)
+
+    def match(self, *args, **kwargs):
+        return self.timed('match', *args, **kwargs)
+
+    def fullmatch(self, *args, **kwargs):
+        return self.timed('fullmatch', *args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        return self.timed('search', *args, **kwargs)
+
+    def findall(self, *args, **kwargs):
+        return self.timed('findall', *args, **kwargs)
+
+    def split(self, *args, **kwargs):
+        return self.timed('split', *args, **kwargs)
+
+    def finditer(self, *args, **kwargs):
+        # only the creation of the iterator is timed
+        return self.timed('finditer', *args, **kwargs)
+
+
+def enable(module):
+    prefix = os.path.splitext(os.path.basename(module.__file__))[0]
+    for name, value in list(vars(module).items()):
+        if isinstance(value, Pattern):
+            setattr(module, name, TimedRegex('%s.%s' % (prefix, name), value))
+        elif isinstance(value, list) and value and all(isinstance(x, tuple) and x and isinstance(x[0], Pattern) for x in value):
+            value[:] = [(TimedRegex('%s.%s[%d]' % (prefix, name, i), x[0]),) + tuple(x[1:]) for i, x in enumerate(value)]
+
+
+def stats():
+    """returns [(name, pattern, calls, seconds)], the slowest first"""
+    return sorted(((name, pattern, calls, seconds) for name, (pattern, calls, seconds) in _stats.items()),
+        key=lambda x: -x[3])
+
+
+def report(out=sys.stderr, limit=None):
+    total = sum(x[3] for x in stats())
+    print('%8s %9s %6s  %s' % ('seconds', 'calls', '%', 'regexp'), file=out)
+    for name, pattern, calls, seconds in stats()[:limit]:
+        if not calls:
+            continue
+        print('%8.3f %9d %5.1f%%  %s  %s' % (seconds, calls, 100 * seconds / total if total else 0,
+            name, pattern[:80]), file=out)
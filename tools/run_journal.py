@@ -0,0 +1,50 @@
+"""
+Append-only journal of a parse_many run
+
+Each line of <api_directory>/runs/<run_id>.jsonl is an event for a dosleg url:
+"queued" when the run starts, "started" when its parsing begins and then
+one of "ok", "error", "skipped", "unchanged" or "interrupted".
+
+The lines are small and written in one call so several worker processes
+can append to the same journal.
+"""
+import json, os, time
+
+FINAL_STATUSES = ('ok', 'error', 'skipped', 'unchanged')
+
+
+def new_run_id():
+    # the pid keeps apart the runs started in the same second
+    return '%s-%d' % (time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+
+
+def journal_path(api_directory, run_id):
+    return os.path.join(api_directory, 'runs', run_id + '.jsonl')
+
+
+def append(path, url, status, **details):
+    event = dict(details, url=url, status=status, time=round(time.time(), 3))
+    with open(path, 'a') as f:
+        f.write(json.dumps(event, ensure_ascii=False, sort_keys=True) + '\n')
+
+
+def read(path):
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # last line of a run killed while writing it
+                continue
+
+
+def remaining_urls(path, retry_errors=False):
+    """the queued urls, in order, that did not reach a final status"""
+    queued = []
+    last_status = {}
+    for event in read(path):
+        if event['status'] == 'queued':
+            queued.append(event['url'])
+        last_status[event['url']] = event['status']
+    done = [status for status in FINAL_STATUSES if not (retry_errors and status == 'error')]
+    return [url for url in dict.fromkeys(queued) if last_status.get(url) not in done]
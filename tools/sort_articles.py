@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import re
-from functools import cmp_to_key
+from functools import cmp_to_key, lru_cache
 
 # Handle all bis-ter words until 27 included
 # (adding 28 duodetrecies creates more complexity)
@@ -31,13 +31,18 @@ re_clean_befaft = re.compile(r"^(a(vant|près)\s*l'|article\s*)+", re.I)
 re_add_spaces = re.compile(r'([A-Z])\s*')
 add_spaces = lambda x: re_add_spaces.sub(r'\1 ', x)
 def split_article(a):
+    return list(article_key(a))
+
+# the same titles are compared many times when completing a text
+@lru_cache(maxsize=8192)
+def article_key(a):
     if not re_article.match(re_clean_befaft.sub('', a)):
-        return [0, a]
+        return (0, a)
     m = re_article.search(a)
     res = [int(m.group(1))]
     if m.group(2):
         res += add_spaces(m.group(2)).strip().split(' ')
-    return res
+    return tuple(res)
 
 hash_bis = {'u': 1, 'b': 2, 't': 3, 'o': 8, 'n': 9,
   'qua': 4, 'qui': 5, 'sex': 6, 'sep': 7, 'du': 2, 'de': 0, 'tri': 0, 'v': 0}
@@ -104,8 +109,8 @@ def compare_details(a, b):
 def compare_articles(a, b):
     if a == b:
         return 0
-    na = split_article(a)
-    nb = split_article(b)
+    na = list(article_key(a))
+    nb = list(article_key(b))
     # compare numbers
     if na[0] != nb[0]:
         return na[0] - nb[0]
@@ -0,0 +1,74 @@
+"""
+Keep the texts of the steps on disk instead of in memory (--low-memory)
+
+With --low-memory, `spill()` replaces the texts of a step by {'spilled': path}
+and `load()` reads them again when a stage needs them, so only the texts in
+use are in memory. Without it, these functions return the texts unchanged.
+
+A text modified after being loaded must be put back with `store()`.
+"""
+import os, pickle, sys, tempfile
+
+try:
+    from .common import open_json
+except ImportError:
+    from common import open_json
+
+_files = []
+
+
+def enabled():
+    return '--low-memory' in sys.argv
+
+
+def is_spilled(value):
+    return isinstance(value, dict) and list(value.keys()) == ['spilled']
+
+
+def spill(step, key):
+    if not enabled() or key not in step or is_spilled(step[key]):
+        return
+    fd, path = tempfile.mkstemp(prefix='lawfactory_', suffix='.pickle')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(step[key], f, pickle.HIGHEST_PROTOCOL)
+    _files.append(path)
+    step[key] = {'spilled': path}
+
+
+def store(step, key, value):
+    step[key] = value
+    spill(step, key)
+
+
+def keep_on_disk(step, key, json_file):
+    """the value is already written as json in `json_file`"""
+    if enabled():
+        step[key] = {'spilled': json_file}
+
+
+def load(value):
+    if not is_spilled(value):
+        return value
+    path = value['spilled']
+    if path.endswith('.json'):
+        return open_json(path)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def get(step, key, default=None):
+    return load(step.get(key, default))
+
+
+def texts_key(step):
+    """the key of the most complete version of the text of a step"""
+    return 'articles_completed' if 'articles_completed' in step else 'articles'
+
+
+def clear():
+    for path in _files:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    del _files[:]
@@ -0,0 +1,127 @@
+"""
+Wall-clock timings of the stages of the parsing of a dosleg
+
+    with timings.stage('parse_texte'):
+        ...
+
+A stage entered several times is accumulated. Each thread has its own stack
+of stages, the http requests done by the downloader, and their size, are
+counted in the innermost running stage of the thread which does them. The
+functions run by worker threads are wrapped with `in_current_stage()` so
+they count in the stage which started them.
+
+The time of a stage is its wall time: when it's running in several threads
+at once, the time is counted once, `threads_time` is the sum over the threads.
+"""
+import json, threading, time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_stages = {}
+_local = threading.local()
+_start = time.perf_counter()
+
+
+def reset():
+    global _start
+    with _lock:
+        _stages.clear()
+        _local.__dict__.clear()
+        _start = time.perf_counter()
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _get(name):
+    if name not in _stages:
+        _stages[name] = {'calls': 0, 'time': 0.0, 'threads_time': 0.0, 'requests': 0, 'bytes': 0,
+            'running': 0, 'since': 0.0}
+    return _stages[name]
+
+
+@contextmanager
+def stage(name):
+    _stack().append(name)
+    start = time.perf_counter()
+    with _lock:
+        timing = _get(name)
+        if not timing['running']:
+            timing['since'] = start
+        timing['running'] += 1
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _stack().pop()
+        with _lock:
+            timing = _get(name)
+            timing['calls'] += 1
+            timing['threads_time'] += end - start
+            timing['running'] -= 1
+            if not timing['running']:
+                timing['time'] += end - timing['since']
+
+
+def in_current_stage(function):
+    """wraps a function to run in a worker thread, it counts in the current stages of the calling thread"""
+    stack = list(_stack())
+
+    def run_in_stage(*args, **kwargs):
+        previous = _stack()[:]
+        _local.stack = list(stack)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.stack = previous
+    return run_in_stage
+
+
+def count_request(size):
+    stack = _stack()
+    with _lock:
+        timing = _get(stack[-1] if stack else 'other')
+        timing['requests'] += 1
+        timing['bytes'] += size
+
+
+def report():
+    """returns {'total': seconds, 'stages': {name: {calls, time, threads_time, requests, bytes}}}"""
+    with _lock:
+        stages = {}
+        for name, timing in _stages.items():
+            stages[name] = {key: value for key, value in timing.items() if key not in ('running', 'since')}
+            stages[name]['time'] = round(timing['time'], 3)
+            stages[name]['threads_time'] = round(timing['threads_time'], 3)
+    return {
+        'total': round(time.perf_counter() - _start, 3),
+        'stages': stages,
+    }
+
+
+def save(filename):
+    with open(filename, 'w') as f:
+        json.dump(report(), f, sort_keys=True, indent=2)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def print_percentiles(reports):
+    """print the distribution of the time spent in each stage over several doslegs"""
+    stages = {}
+    for timing in reports:
+        for name, stage_timing in timing['stages'].items():
+            stages.setdefault(name, []).append(stage_timing)
+        stages.setdefault('total', []).append({'time': timing['total'], 'requests': 0, 'bytes': 0})
+    print('%-25s %6s %8s %8s %8s %8s %10s %10s' % ('STAGE', 'COUNT', 'P50', 'P90', 'P99', 'MAX', 'REQUESTS', 'MB'))
+    for name, stage_timings in sorted(stages.items(), key=lambda x: -sum(t['time'] for t in x[1])):
+        times = [t['time'] for t in stage_timings]
+        print('%-25s %6d %8.2f %8.2f %8.2f %8.2f %10d %10.1f' % (name, len(times),
+            percentile(times, 50), percentile(times, 90), percentile(times, 99), max(times),
+            sum(t['requests'] for t in stage_timings), sum(t['bytes'] for t in stage_timings) / 1024 / 1024))
@@ -0,0 +1,112 @@
+"""
+Persistent store of what we learnt about urls: the url they resolve to
+(the good page of a text, the right form of an url,...) and their status
+
+The entries are kept by kind (TEXT, STATUS, AMENDEMENTS): the same url can
+be checked for its status and resolved to the page of a text, the answers
+are not the same.
+
+An entry is forgotten after POSITIVE_TTL, or NEGATIVE_TTL if the url led
+nowhere (resolved_url is None). The store is a SQLite database in
+cache/url_resolutions.sqlite (or in $LAWFACTORY_URL_RESOLUTIONS).
+
+Usage: python tools/url_resolutions.py stats|purge
+"""
+import os, sqlite3, sys, threading, time
+
+try:
+    from .downloader import download, store_key
+except ImportError:
+    from downloader import download, store_key
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+POSITIVE_TTL = 7 * 86400
+NEGATIVE_TTL = 86400
+
+# the kinds of entries
+TEXT = 'text'
+STATUS = 'status'
+AMENDEMENTS = 'amendements'
+
+_db = None
+_db_pid = None
+# the connection is shared by the threads parsing the texts
+_lock = threading.Lock()
+
+
+def store_path():
+    return os.getenv('LAWFACTORY_URL_RESOLUTIONS') or os.path.join(ROOT_DIRECTORY, 'cache', 'url_resolutions.sqlite')
+
+
+def db():
+    global _db, _db_pid
+    # a forked worker opens its own connection
+    if _db is None or _db_pid != os.getpid():
+        os.makedirs(os.path.dirname(store_path()), exist_ok=True)
+        _db = sqlite3.connect(store_path(), timeout=60, isolation_level=None, check_same_thread=False)
+        _db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            kind TEXT NOT NULL,
+            url TEXT NOT NULL,
+            resolved_url TEXT,
+            status INTEGER,
+            checked REAL NOT NULL,
+            PRIMARY KEY (kind, url))""")
+        _db_pid = os.getpid()
+    return _db
+
+
+def lookup(kind, url):
+    """returns {'resolved_url', 'status', 'checked'} or None if it's unknown or expired"""
+    with _lock:
+        row = db().execute('SELECT resolved_url, status, checked FROM entries WHERE kind = ? AND url = ?',
+            (kind, store_key(url))).fetchone()
+    if row is None:
+        return None
+    resolved_url, status, checked = row
+    ttl = POSITIVE_TTL if resolved_url else NEGATIVE_TTL
+    if checked + ttl < time.time():
+        return None
+    return {'resolved_url': resolved_url, 'status': status, 'checked': checked}
+
+
+def remember(kind, url, resolved_url, status):
+    with _lock:
+        db().execute('INSERT OR REPLACE INTO entries (kind, url, resolved_url, status, checked) VALUES (?, ?, ?, ?, ?)',
+            (kind, store_key(url), resolved_url, status, time.time()))
+
+
+def forget(kind, url):
+    with _lock:
+        db().execute('DELETE FROM entries WHERE kind = ? AND url = ?', (kind, store_key(url)))
+
+
+def get_status(url):
+    """status code of an url, downloaded only if it's not known"""
+    entry = lookup(STATUS, url)
+    if entry:
+        return entry['status']
+    status = download(url).status_code
+    remember(STATUS, url, url if status == 200 else None, status)
+    return status
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    if command == 'stats':
+        now = time.time()
+        print('store:', store_path())
+        for label, condition in ('positive', 'resolved_url IS NOT NULL AND checked > ?'), \
+                ('negative', 'resolved_url IS NULL AND checked > ?'):
+            ttl = POSITIVE_TTL if label == 'positive' else NEGATIVE_TTL
+            print('%s entries:' % label, db().execute('SELECT COUNT(*) FROM entries WHERE ' + condition,
+                (now - ttl,)).fetchone()[0])
+        print('expired entries:', db().execute("""SELECT COUNT(*) FROM entries
+            WHERE (resolved_url IS NOT NULL AND checked <= ?) OR (resolved_url IS NULL AND checked <= ?)""",
+            (now - POSITIVE_TTL, now - NEGATIVE_TTL)).fetchone()[0])
+    elif command == 'purge':
+        db().execute('DELETE FROM entries')
+        print('purged', store_path())
+    else:
+        print(__doc__)
+        sys.exit(1)